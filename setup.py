@@ -5,7 +5,7 @@ import re
 
 from setuptools import setup
 
-long_description = open('README.rst').read()
+long_description = open('README.md').read()
 
 
 def get_version():
@@ -25,6 +25,7 @@ setup(
     url='https://github.com/phonkee/vcontext',
     description='Context data structure',
     long_description=long_description,
+    long_description_content_type='text/markdown',
 
     # author information
     author='Peter Vrba',
@@ -1,4 +1,7 @@
-from .context import Context
+from .context import Accessor, Context, ContextView, Journal, Memo, PathIndex, SparseList, Stats
+from .layered import LayeredContext
+from .lazy import LazyDict, LazyList, LazyTuple
+from .shared import SharedContext
 
 __author__ = 'Peter Vrba <phonkee@phonkee.eu>'
 
@@ -6,6 +9,18 @@ __author__ = 'Peter Vrba <phonkee@phonkee.eu>'
 __version__ = "0.23"
 
 __all__ = [
+    'Accessor',
     'Context',
+    'ContextView',
+    'Journal',
+    'LayeredContext',
+    'LazyDict',
+    'LazyList',
+    'LazyTuple',
+    'Memo',
+    'PathIndex',
+    'SharedContext',
+    'SparseList',
+    'Stats',
     '__version__'
 ]
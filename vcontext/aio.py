@@ -0,0 +1,170 @@
+"""
+Aio
+
+asyncio support of context. Awaitables and coroutine functions (or callables that return awaitable) stored in context
+are lazy values, they are awaited when item is resolved by aget/resolve. Awaited result replaces lazy value in data,
+so every lazy value is awaited only once (concurrent resolvers share single task) and following reads (also
+synchronous __getitem__) return result directly. If awaiting fails or every resolver awaiting it is cancelled, original
+value is restored (store callables to be able to retry, awaitable object can be awaited only once).
+
+This module is python 3 only, it's imported by Context.aget/Context.resolve when they are called.
+"""
+import asyncio
+import inspect
+
+# task => [number of resolvers awaiting it, original value]
+_pending = {}
+
+
+async def aget(context, item):
+    """
+    Return item of context, all lazy values on path are awaited
+    :param context: Context
+    :param item: dotted item or Accessor
+    :return: value
+    """
+    context, parsed = _root(context, context._parse_path(item))
+    return await _resolve(context, parsed)
+
+
+async def resolve(context, items):
+    """
+    Return values of multiple items, items are resolved concurrently (asyncio.gather)
+    :param context: Context
+    :param items: iterable of dotted items
+    :return: list of values (in order of items)
+    """
+    return list(await asyncio.gather(*[aget(context, item) for item in items]))
+
+
+def _root(context, parsed):
+    """
+    Return root context and parts relative to it (views store lazy values in data of root context)
+    :param context: Context or ContextView
+    :param parsed: tuple of parts
+    :return: (context, parsed)
+    """
+    if not parsed:
+        raise KeyError('no key provided')
+
+    while getattr(context, 'prefix', None) is not None:
+        parsed = context.prefix + tuple(parsed)
+        context = context.context
+
+    return context, parsed
+
+
+async def _resolve(context, parsed):
+    """
+    Return value by parsed parts, lazy values on path are awaited and replaced by results.
+    :param context: Context
+    :param parsed: tuple of parts
+    :return: value
+    """
+    actual = context._data
+
+    for i, part in enumerate(parsed):
+        container = actual
+        try:
+            actual = container[part]
+        except TypeError:
+            try:
+                actual = getattr(container, part)
+            except (AttributeError, TypeError):
+                raise KeyError(".".join([str(x) for x in parsed[:i + 1]]))
+        except (KeyError, IndexError):
+            raise KeyError(".".join([str(x) for x in parsed[:i + 1]]))
+
+        if callable(actual) or inspect.isawaitable(actual):
+            actual = await _settle(context, container, parsed[:i + 1], actual)
+
+    return actual
+
+
+async def _settle(context, container, parts, value):
+    """
+    Resolve lazy value stored in container by last part. Plain callables are called (same as __getitem__ does),
+    awaitables are awaited as task stored in place of value, so concurrent resolvers await same task. Task is awaited
+    shielded, so cancelled resolver does not cancel it for others. If task fails or the last resolver awaiting it
+    is cancelled, original value is restored (task never stays in data).
+    :param context: Context
+    :param container: dict/list where value is stored
+    :param parts: tuple of parts of value
+    :param value: lazy value
+    :return: result
+    """
+    original = value
+
+    while callable(value) or inspect.isawaitable(value):
+        while callable(value):
+            value = value()
+
+        if not inspect.isawaitable(value):
+            break
+
+        task = value
+        if task not in _pending:
+            if not isinstance(task, asyncio.Future):
+                task = asyncio.ensure_future(task)
+                _store(context, container, parts, task, current=original)
+            _pending[task] = [0, original]
+
+        entry = _pending[task]
+        entry[0] += 1
+
+        try:
+            value = await asyncio.shield(task)
+        except BaseException:
+            entry[0] -= 1
+            if not entry[0]:
+                del _pending[task]
+                if entry[1] is not task:
+                    task.cancel()
+                _store(context, container, parts, entry[1], current=task)
+            raise
+
+        entry[0] -= 1
+        if not entry[0]:
+            _pending.pop(task, None)
+
+        _store(context, container, parts, value, current=task)
+        original = value
+
+    return value
+
+
+def _store(context, container, parts, value, current):
+    """
+    Replace value in container (if container supports it and value was not changed meanwhile), index and memo of
+    context are updated. Copy on write context gets its own copy of container first.
+    :param context: Context
+    :param container: dict/list where value was found
+    :param parts: tuple of parts of value
+    :param value: new value
+    :param current: value that is replaced
+    :return:
+    """
+    if value is current:
+        return
+
+    if context._owned is not None:
+        context._unshare(parts)
+        container = context._data
+        try:
+            for part in parts[:-1]:
+                container = container[part]
+        except (KeyError, TypeError, IndexError):
+            return
+
+    try:
+        if container[parts[-1]] is not current:
+            return
+        container[parts[-1]] = value
+    except (KeyError, TypeError, IndexError):
+        return
+
+    if context._memo is not None:
+        context._memo.invalidate(parts)
+
+    if context._index is not None:
+        context._index.refresh(context._data, parts)
@@ -0,0 +1,330 @@
+"""
+Benchmarks
+
+benchmarks of context hot paths. Run them with:
+
+    python -m vcontext.benchmarks [--json] [--save baseline.json] [--baseline baseline.json --threshold 1.25]
+
+Data are parametrized by depth and width of dict tree, length of list and number of accessed keys, expand is
+measured for every given number of combinations. With --baseline every benchmark slower than threshold * baseline
+is reported as regression and exit code is 1, baseline recorded with different params is refused.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+import timeit
+from collections import OrderedDict
+
+from .context import Context
+
+# default parameters of data
+DEPTH = 4
+WIDTH = 5
+LENGTH = 1000
+KEYS = 500
+COMBINATIONS = (10, 100, 1000)
+
+# minimal time of single measurement (number of loops is increased until it's reached)
+MIN_TIME = 0.2
+
+# name => function(params) that returns function to be measured
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register benchmark. Decorated function is called with params dict and returns function without arguments that
+    is measured (or dict of variant => function).
+    :param name: name of benchmark
+    :return: decorator
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def make_data(depth, width, length):
+    """
+    Return data with dict tree of given depth and width and list of given length
+    :param depth: depth of dict tree
+    :param width: number of keys in every dict
+    :param length: length of list
+    :return: dict
+    """
+    def tree(level):
+        if level == depth:
+            return level
+        return dict(('key{}'.format(i), tree(level + 1)) for i in range(width))
+
+    return {
+        'tree': tree(0),
+        'list': [{'id': i, 'value': {'name': 'item{}'.format(i)}} for i in range(length)],
+    }
+
+
+def make_items(data, keys):
+    """
+    Return list of given number of dotted items of leaves of data. Leaves are picked with even stride across all
+    leaves (so both tree and list are accessed), items repeat if there are less leaves.
+    :param data: data made by make_data
+    :param keys: number of items
+    :return: list of dotted items
+    """
+    leaves = Context.from_data(data).keys()
+    step = len(leaves) / float(keys)
+    return [leaves[int(i * step) % len(leaves)] for i in range(keys)]
+
+
+@benchmark('getitem')
+def bench_getitem(params):
+    context = Context.from_data(make_data(params['depth'], params['width'], params['length']))
+    items = make_items(context.data, params['keys'])
+
+    def run():
+        for item in items:
+            context[item]
+    return run
+
+
+@benchmark('setitem')
+def bench_setitem(params):
+    items = make_items(make_data(params['depth'], params['width'], params['length']), params['keys'])
+
+    def run():
+        context = Context()
+        for item in items:
+            context[item] = 1
+    return run
+
+
+@benchmark('delitem')
+def bench_delitem(params):
+    """
+    Every item is deleted and set back (set is measured too)
+    """
+    context = Context.from_data(make_data(params['depth'], params['width'], params['length']))
+    items = sorted(set(make_items(context.data, params['keys'])))
+
+    def run():
+        for item in items:
+            del context[item]
+            context[item] = 1
+    return run
+
+
+@benchmark('set_list')
+def bench_set_list(params):
+    items = ['list.{}.value'.format(i) for i in range(params['length'])]
+
+    def run():
+        context = Context()
+        for item in items:
+            context[item] = 1
+    return run
+
+
+@benchmark('keys')
+def bench_keys(params):
+    context = Context.from_data(make_data(params['depth'], params['width'], params['length']))
+    return context.keys
+
+
+@benchmark('items')
+def bench_items(params):
+    context = Context.from_data(make_data(params['depth'], params['width'], params['length']))
+    return context.items
+
+
+@benchmark('update')
+def bench_update(params):
+    data = make_data(params['depth'], params['width'], params['length'])
+
+    def run():
+        Context().update(data)
+    return run
+
+
+@benchmark('copy')
+def bench_copy(params):
+    context = Context.from_data(make_data(params['depth'], params['width'], params['length']))
+    return {
+        'deep': context.copy,
+        'cow': lambda: context.copy(cow=True),
+    }
+
+
+@benchmark('dumps')
+def bench_dumps(params):
+    context = Context.from_data(make_data(params['depth'], params['width'], params['length']))
+    return context.dumps
+
+
+@benchmark('expand')
+def bench_expand(params):
+    result = {}
+
+    for combinations in params['combinations']:
+        context = Context({
+            'name': {'__range__': [combinations], '__format__': 'name_{value}'},
+            'nested': {'flag': {'__choices__': [True]}, 'list': [1, 2, 3]},
+        })
+        result[str(combinations)] = lambda context=context: [item for item in context.expand()]
+
+    return result
+
+
+def measure(func, repeat=5, min_time=MIN_TIME):
+    """
+    Measure function, number of loops is increased until single measurement takes at least min_time.
+    :param func: function without arguments
+    :param repeat: number of measurements
+    :param min_time: minimal time of measurement in seconds
+    :return: dict with best/mean time of single call (seconds) and number of loops
+    """
+    timer = timeit.Timer(func)
+
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    times = [elapsed] + timer.repeat(repeat=max(repeat - 1, 0), number=number)
+    times = [item / number for item in times]
+
+    return {
+        'best': min(times),
+        'mean': sum(times) / len(times),
+        'loops': number,
+    }
+
+
+def run(names=None, repeat=5, min_time=MIN_TIME, **params):
+    """
+    Run benchmarks
+    :param names: names of benchmarks (all if not given)
+    :param repeat: number of measurements
+    :param min_time: minimal time of measurement in seconds
+    :param params: depth, width, length, keys, combinations
+    :return: ordered dict name => result (see measure)
+    """
+    params.setdefault('depth', DEPTH)
+    params.setdefault('width', WIDTH)
+    params.setdefault('length', LENGTH)
+    params.setdefault('keys', KEYS)
+    params.setdefault('combinations', COMBINATIONS)
+
+    results = OrderedDict()
+
+    for name in sorted(names or BENCHMARKS):
+        funcs = BENCHMARKS[name](params)
+        if callable(funcs):
+            funcs = {None: funcs}
+
+        for variant, func in sorted(funcs.items(), key=lambda item: (len(str(item[0])), str(item[0]))):
+            key = name if variant is None else '{}[{}]'.format(name, variant)
+            results[key] = measure(func, repeat=repeat, min_time=min_time)
+
+    return results
+
+
+def compare(results, baseline, threshold=1.25):
+    """
+    Compare results with baseline
+    :param results: results of run
+    :param baseline: results of previous run
+    :param threshold: maximum allowed ratio of best time to baseline best time
+    :return: list of (name, ratio) of regressions
+    """
+    regressions = []
+
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = result['best'] / baseline[name]['best']
+        if ratio > threshold:
+            regressions.append((name, ratio))
+
+    return regressions
+
+
+def changed_params(params, baseline):
+    """
+    Return names of params that differ from params recorded in baseline (results are not comparable then)
+    :param params: params of run
+    :param baseline: saved output with params and results
+    :return: sorted list of names
+    """
+    recorded = baseline.get('params', {})
+    return sorted(name for name in set(params) | set(recorded) if params.get(name) != recorded.get(name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m vcontext.benchmarks', description='vcontext benchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run: {}'.format(', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('--depth', type=int, default=DEPTH)
+    parser.add_argument('--width', type=int, default=WIDTH)
+    parser.add_argument('--length', type=int, default=LENGTH)
+    parser.add_argument('--keys', type=int, default=KEYS)
+    parser.add_argument('--combinations', type=int, nargs='+', default=list(COMBINATIONS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=MIN_TIME)
+    parser.add_argument('--json', action='store_true', help='print results as json')
+    parser.add_argument('--save', metavar='FILE', help='save results to file (to be used as baseline)')
+    parser.add_argument('--baseline', metavar='FILE', help='compare results with baseline')
+    parser.add_argument('--threshold', type=float, default=1.25, help='allowed slowdown against baseline')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+
+    params = {
+        'depth': args.depth,
+        'width': args.width,
+        'length': args.length,
+        'keys': args.keys,
+        'combinations': args.combinations,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        changed = changed_params(params, baseline)
+        if changed:
+            parser.error('params differ from baseline: {}'.format(', '.join(
+                '{}={} (baseline {})'.format(name, params.get(name), baseline.get('params', {}).get(name))
+                for name in changed)))
+
+    results = run(args.names, repeat=args.repeat, min_time=args.min_time, **params)
+    output = {'params': params, 'results': results}
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+
+    regressions = []
+    if baseline is not None:
+        regressions = compare(results, baseline['results'], threshold=args.threshold)
+        output['regressions'] = dict(regressions)
+
+    if args.json:
+        print(json.dumps(output, indent=2, sort_keys=True))
+    else:
+        for name, result in results.items():
+            print('{:<20} {:>12.1f} us  (mean {:.1f} us, {} loops)'.format(
+                name, result['best'] * 1e6, result['mean'] * 1e6, result['loops']))
+        for name, ratio in regressions:
+            print('REGRESSION {:<20} {:.2f}x of baseline time'.format(name, ratio))
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
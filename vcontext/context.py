@@ -6,268 +6,2411 @@ See README.md
 """
 from __future__ import print_function
 
+import array
+import bisect
 import copy
+import functools
 import itertools
 import json
+import re
+import time
+import timeit
+from collections import OrderedDict
 
 import six
 
+try:
+    from collections.abc import MutableSequence
+except ImportError:  # pragma: no cover
+    from collections import MutableSequence
 
-class Context(object):
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from . import lazy as _lazy
+from . import snapshot as _snapshot
+from .expand import Expansion, slot_values
+
+# maximum number of distinct parsed items kept in cache
+PARSE_CACHE_SIZE = 4096
+
+# default maximum number of memoized callable values
+MEMO_SIZE = 1024
+
+
+def _cached(func, maxsize):
     """
-    Context object
+    Return function of single argument with LRU cache of results (functools.lru_cache is missing on python 2).
+    :param func: function of single hashable argument
+    :param maxsize: maximum number of cached results
+    :return: function
+    """
+    cache = OrderedDict()
 
-    context is dict-like structure that has custom get/set/del item.
+    @functools.wraps(func)
+    def wrapper(arg):
+        try:
+            # mark as recently used
+            result = cache.pop(arg)
+        except KeyError:
+            result = func(arg)
+            if len(cache) >= maxsize:
+                cache.popitem(last=False)
+        cache[arg] = result
+        return result
+
+    wrapper.cache_clear = cache.clear
+    return wrapper
+
+
+def _disown(owned, value):
+    """
+    Remove value and all its descendants from nodes owned by copy on write context. Parent of every owned node is
+    owned as well, so walk stops at nodes that are not owned.
+    :param owned: dict id => owned node
+    :param value: value that is replaced or deleted
+    :return:
+    """
+    stack = [value]
+
+    while stack:
+        node = stack.pop()
+        if owned.get(id(node)) is not node:
+            continue
+
+        del owned[id(node)]
+
+        if isinstance(node, dict):
+            stack.extend(dict.values(node))
+        elif isinstance(node, SparseList):
+            stack.extend(item for _, item in node.items())
+        else:
+            stack.extend(node)
+
+
+def _split(item):
+    """
+    Parse dotted item into tuple of parts.
+    :param item: dotted item
+    :return: tuple of parts
+    """
+    result = []
+
+    for part in item.split('.'):
+        try:
+            result.append(int(part))
+        except ValueError:
+            result.append(part)
+
+    return tuple(result)
+
+
+# parsed items are cached so every distinct item is parsed only once
+_parse = _cached(_split, PARSE_CACHE_SIZE)
+
+# wildcards in patterns: ANY matches exactly one part, DEEP matches any number of parts (including none)
+ANY = '*'
+DEEP = '**'
+
+
+def _split_pattern(pattern):
+    """
+    Parse dotted pattern into tuple of parts, wildcards are left as they are and "start:stop[:step]" parts are
+    converted to slices.
+    :param pattern: dotted pattern such as 'users.*.email' or 'results.0:10.id'
+    :return: tuple of parts
+    """
+    result = []
+
+    for part in _split(pattern):
+        if isinstance(part, six.string_types) and ':' in part and part not in (ANY, DEEP):
+            try:
+                part = slice(*[int(bound) if bound else None for bound in part.split(':')])
+            except (TypeError, ValueError):
+                pass
+        result.append(part)
+
+    return tuple(result)
+
+
+# compiled patterns are cached same as parsed items
+_parse_pattern = _cached(_split_pattern, PARSE_CACHE_SIZE)
+
+
+def _part_key(part):
+    """
+    Sort key for part, integer parts are sorted numerically before string parts.
+    :param part: key or index
+    :return:
+    """
+    if isinstance(part, six.integer_types):
+        return 0, part, ''
+    return 1, 0, str(part)
+
+
+def _sort_key(item):
+    """
+    Sort key for (key, value) pair
+    :param item: (key, value) tuple
+    :return:
+    """
+    return _part_key(item[0])
+
+
+def _parts_key(item):
+    """
+    Sort key for (parts, value) pair
+    :param item: (parts, value) tuple
+    :return:
+    """
+    return tuple(_part_key(part) for part in item[0])
+
+
+_digit = re.compile(r'\d')
+
+
+def _is_plain(key):
+    """
+    Return whether key is used as it is (it doesn't need to be parsed)
+    :param key: dict key
+    :return: bool
+    """
+    if isinstance(key, six.integer_types):
+        return True
+    if not isinstance(key, six.string_types) or '.' in key:
+        return False
+    if _digit.search(key) is None:
+        return True
+    try:
+        int(key)
+    except ValueError:
+        return True
+    return False
+
+
+def _grow(seq, index):
+    """
+    Grow list (or SparseList) in place so it contains index, new items are None
+    :param seq: list or SparseList
+    :param index: index
+    :return:
+    """
+    length = len(seq)
+    if index >= length:
+        if isinstance(seq, SparseList):
+            seq.resize(index + 1)
+        else:
+            seq.extend(itertools.repeat(None, index + 1 - length))
+
+
+# marker of missing dict key in undo records
+_missing = object()
+
+
+def _record(undo, obj, part):
+    """
+    Append undo record of obj[part] (before it's changed) to undo list
+    :param undo: list of undo records
+    :param obj: dict/list
+    :param part: key or index
+    :return:
+    """
+    if isinstance(obj, dict):
+        undo.append((obj, part, obj.get(part, _missing)))
+    elif isinstance(obj, _sequences) and isinstance(part, six.integer_types):
+        length = len(obj)
+        if part >= length:
+            # list will grow, so it's shrinked back
+            undo.append((obj, None, length))
+        else:
+            undo.append((obj, part, obj[part]))
+
+
+def _rollback(undo):
+    """
+    Revert all changes recorded in undo list (in reverse order)
+    :param undo: list of undo records
+    :return:
+    """
+    for obj, part, value in reversed(undo):
+        if part is None:
+            if isinstance(obj, SparseList):
+                obj.resize(value)
+            else:
+                del obj[value:]
+        elif value is _missing:
+            del obj[part]
+        else:
+            obj[part] = value
+
+
+def _lookup(obj, parsed, memo=None, prefix=()):
+    """
+    Return value in obj by parsed parts, callable values are called.
+    :param obj: dict/list or object
+    :param parsed: tuple of parts
+    :param memo: Memo used to cache results of callable values (None means callables are always called)
+    :param prefix: tuple of parts of obj in data of context (memo is keyed by full parts)
+    :return:
+    """
+    for i, part in enumerate(parsed):
+        try:
+            obj = obj[part]
+        except TypeError:
+            try:
+                obj = getattr(obj, part)
+            except (AttributeError, TypeError):
+                raise KeyError(".".join([str(x) for x in prefix + parsed[:i + 1]]))
+        except (KeyError, IndexError):
+            raise KeyError(".".join([str(x) for x in prefix + parsed[:i + 1]]))
+
+        if callable(obj):
+            obj = _call(obj, memo, prefix + parsed[:i + 1])
+
+    return obj
+
+
+def _call(value, memo, parts):
+    """
+    Return result of callable value, result is cached by memo (if given) under full parts of value
+    :param value: callable
+    :param memo: Memo or None
+    :param parts: tuple of parts of value
+    :return:
+    """
+    if memo is not None:
+        return memo.resolve(parts, value)
+
+    while callable(value):
+        value = value()
+
+    return value
+
+
+def _json_default(obj):
+    """
+    Default for json.dumps, supports SparseList and deferred values of LazyDict
+    :param obj:
+    :return:
+    """
+    if isinstance(obj, SparseList):
+        return list(obj)
+    if isinstance(obj, _lazy.Deferred):
+        return obj.load()
+    raise TypeError('Object of type {} is not JSON serializable'.format(obj.__class__.__name__))
+
+
+def json_encoder(obj):
+    """
+    Encoder that uses json from standard library
+    :param obj: value to be encoded
+    :return: json string
+    """
+    return json.dumps(obj, default=_json_default)
+
+
+def orjson_encoder(obj):
+    """
+    Encoder that uses orjson (opt in by Context.new(encoder=orjson_encoder)). Output is compact and not ascii escaped,
+    NaN/Infinity are encoded as null. Values that orjson doesn't support (e.g. big integers) are encoded by json from
+    standard library with same formatting, so output format does not depend on values.
+    :param obj: value to be encoded
+    :return: json string
+    """
+    if orjson is None:
+        raise RuntimeError('orjson is not installed')
+
+    try:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    except TypeError:
+        return json.dumps(obj, default=_json_default, separators=(',', ':'), ensure_ascii=False)
+
+
+# default encoder produces same output as json.dumps (with or without orjson installed)
+default_encoder = json_encoder
+
+
+class SparseList(MutableSequence):
+    """
+    SparseList
+
+    list that stores only items that are not None, so lists with very large indexes don't allocate all the None
+    items. Walk (keys, items) yields only stored items.
+    """
+
+    def __init__(self, iterable=()):
+        self._items = {}
+        self._length = 0
+        self.extend(iterable)
+
+    def _index(self, index):
+        """
+        Return normalized index, raise IndexError if out of range
+        :param index:
+        :return:
+        """
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('list index out of range')
+        return index
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(self._length)[index]]
+        return self._items.get(self._index(index))
+
+    def __setitem__(self, index, value):
+        index = self._index(index)
+        if value is None:
+            self._items.pop(index, None)
+        else:
+            self._items[index] = value
+
+    def __delitem__(self, index):
+        index = self._index(index)
+        self._items = dict(
+            (i if i < index else i - 1, value) for i, value in six.iteritems(self._items) if i != index
+        )
+        self._length -= 1
+
+    def insert(self, index, value):
+        if index < 0:
+            index = max(index + self._length, 0)
+        index = min(index, self._length)
+        self._items = dict((i if i < index else i + 1, v) for i, v in six.iteritems(self._items))
+        self._length += 1
+        self[index] = value
+
+    def append(self, value):
+        self._length += 1
+        self[self._length - 1] = value
+
+    def resize(self, length):
+        """
+        Change length of list, new items are None
+        :param length: new length
+        :return:
+        """
+        if length < self._length:
+            self._items = dict((i, v) for i, v in six.iteritems(self._items) if i < length)
+        self._length = length
+
+    def items(self):
+        """
+        Return sorted (index, value) of stored items (not None)
+        :return: list of tuples
+        """
+        return sorted(six.iteritems(self._items))
+
+    def __copy__(self):
+        new = SparseList()
+        new._items = dict(self._items)
+        new._length = self._length
+        return new
+
+    def __eq__(self, other):
+        if isinstance(other, SparseList):
+            return self._length == other._length and self._items == other._items
+        if isinstance(other, (list, tuple)):
+            return self._length == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return '{}(length={}, items={!r})'.format(self.__class__.__name__, self._length, self._items)
+
+
+_sequences = (list, SparseList)
+_containers = (dict, list, tuple, SparseList)
+
+
+class Accessor(object):
+    """
+    Accessor is compiled item
+
+    Item is parsed only once and accessor can be then reused on any context.
+    """
+
+    __slots__ = ('item', 'parts')
+
+    def __init__(self, item):
+        self.item = str(item)
+        self.parts = _parse(self.item)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.item)
+
+    def get(self, context, default=None):
+        """
+        Return value from context, if not found default is returned (context is not changed).
+        :param context: Context instance
+        :param default: default value
+        :return:
+        """
+        try:
+            if context._stats is not None:
+                return context._stats.get_parts(context, self.parts)
+            return context._get_parts(self.parts)
+        except KeyError:
+            return default
+
+    def set(self, context, value):
+        """
+        Set value in context
+        :param context: Context instance
+        :param value: value to be set
+        :return:
+        """
+        if context._stats is not None:
+            return context._stats.set_parts(context, self.parts, value)
+        context._set_parts(self.parts, value)
+
+    def delete(self, context):
+        """
+        Delete value from context, raises KeyError if not found
+        :param context: Context instance
+        :return:
+        """
+        if context._stats is not None:
+            return context._stats.delete_parts(context, self.parts)
+        context._del_parts(self.parts)
+
+    def exists(self, context):
+        """
+        Return whether item exists in context
+        :param context: Context instance
+        :return: bool
+        """
+        try:
+            if context._stats is not None:
+                context._stats.get_parts(context, self.parts)
+            else:
+                context._get_parts(self.parts)
+        except KeyError:
+            return False
+        return True
+
+
+class Memo(object):
+    """
+    Memo
+
+    LRU cache of results of callable values (parts => result) with optional time to live. Results are cached by
+    path where callable is stored, every change made through context on path invalidates it. Cached paths are also
+    kept in a tree of parts, so invalidation visits only parents and children of changed path.
+    """
+
+    def __init__(self, maxsize=MEMO_SIZE, ttl=None, timer=time.time):
+        """
+        :param maxsize: maximum number of cached results (least recently used are evicted)
+        :param ttl: time to live of results in seconds (None means forever)
+        :param timer: function that returns current time
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        # parts => (result, expires)
+        self._entries = OrderedDict()
+        # part => child node, node of cached parts has _missing key
+        self._tree = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, parts):
+        entry = self._entries.get(parts)
+        return entry is not None and (entry[1] is None or entry[1] > self.timer())
+
+    def resolve(self, parts, value):
+        """
+        Return cached result for parts, if not cached (or expired) callable value is called and result is cached.
+        :param parts: tuple of parts where value is stored
+        :param value: callable value
+        :return: result
+        """
+        entries = self._entries
+        entry = entries.get(parts)
+
+        if entry is not None and (entry[1] is None or entry[1] > self.timer()):
+            # mark as recently used
+            del entries[parts]
+            entries[parts] = entry
+            return entry[0]
+
+        while callable(value):
+            value = value()
+
+        if entries.pop(parts, None) is None:
+            self._link(parts)
+        entries[parts] = (value, None if self.ttl is None else self.timer() + self.ttl)
+
+        while len(entries) > self.maxsize:
+            self._unlink(entries.popitem(last=False)[0])
+
+        return value
+
+    def invalidate(self, parts=()):
+        """
+        Remove cached results on parts (results for parts, its parents and children). All results are removed if
+        no parts are given.
+        :param parts: tuple of parts
+        :return:
+        """
+        if not parts:
+            self._entries.clear()
+            self._tree = {}
+            return
+
+        entries = self._entries
+        node, path = self._tree, []
+
+        # parents
+        for index, part in enumerate(parts):
+            if _missing in node:
+                del node[_missing]
+                del entries[parts[:index]]
+
+            child = node.get(part)
+            if child is None:
+                self._prune(path)
+                return
+
+            path.append((node, part))
+            node = child
+
+        # parts and children (whole subtree is detached)
+        stack = [(node, parts)]
+        while stack:
+            node, cached = stack.pop()
+            for part, child in six.iteritems(node):
+                if part is _missing:
+                    del entries[cached]
+                else:
+                    stack.append((child, cached + (part,)))
+
+        parent, part = path[-1]
+        del parent[part]
+        self._prune(path[:-1])
+
+    def _link(self, parts):
+        """
+        Add parts to tree
+        :param parts: tuple of parts
+        :return:
+        """
+        node = self._tree
+        for part in parts:
+            node = node.setdefault(part, {})
+        node[_missing] = True
+
+    def _unlink(self, parts):
+        """
+        Remove parts from tree (nodes left empty are removed)
+        :param parts: tuple of parts
+        :return:
+        """
+        node, path = self._tree, []
+        for part in parts:
+            path.append((node, part))
+            node = node[part]
+        del node[_missing]
+        if not node:
+            parent, part = path.pop()
+            del parent[part]
+        self._prune(path)
+
+    @staticmethod
+    def _prune(path):
+        """
+        Remove empty nodes on path (deepest first)
+        :param path: list of (parent node, part)
+        :return:
+        """
+        for parent, part in reversed(path):
+            if parent[part]:
+                return
+            del parent[part]
+
+    def copy(self):
+        """
+        Return new empty memo with same settings
+        :return: Memo
+        """
+        return Memo(maxsize=self.maxsize, ttl=self.ttl, timer=self.timer)
+
+
+class _TimedResolver(object):
+    """
+    Resolver of callable values (see _lookup) that measures time spent in callables
+    """
+
+    __slots__ = ('memo', 'timer', 'elapsed')
+
+    def __init__(self, memo, timer):
+        self.memo = memo
+        self.timer = timer
+        self.elapsed = 0.0
+
+    def resolve(self, parts, value):
+        start = self.timer()
+
+        if self.memo is not None:
+            value = self.memo.resolve(parts, value)
+
+        while callable(value):
+            value = value()
+
+        self.elapsed += self.timer() - start
+        return value
+
+
+class Stats(object):
+    """
+    Stats
+
+    instrumentation of item access of context. Stats count get/set/delete/miss for every item and measure cumulative
+    time of phases:
+        * parse - parsing of dotted items
+        * traverse - walking data (get, delete)
+        * resolve - calling callable values (get)
+        * build - building values and items (set)
+    Hooks are called after every access as hook(operation, item, elapsed).
     """
 
-    _data = None
+    OPERATIONS = ('get', 'set', 'delete', 'miss')
+    PHASES = ('parse', 'traverse', 'resolve', 'build')
+
+    def __init__(self, hooks=None, timer=timeit.default_timer):
+        """
+        :param hooks: list of callables hook(operation, item, elapsed)
+        :param timer: function that returns current time
+        """
+        self.hooks = list(hooks or [])
+        self.timer = timer
+        self.reset()
+
+    def reset(self):
+        """
+        Reset all counters and timings
+        :return:
+        """
+        # parts => [get, set, delete, miss]
+        self._counters = {}
+        self._timings = dict.fromkeys(self.PHASES, 0.0)
+
+    def add_hook(self, hook):
+        """
+        Add hook called after every access as hook(operation, item, elapsed)
+        :param hook: callable
+        :return:
+        """
+        self.hooks.append(hook)
+
+    def _record(self, operation, parsed, elapsed):
+        try:
+            counters = self._counters[parsed]
+        except KeyError:
+            counters = self._counters[parsed] = [0, 0, 0, 0]
+        counters[self.OPERATIONS.index(operation)] += 1
+
+        if self.hooks:
+            item = '.'.join([str(part) for part in parsed])
+            for hook in self.hooks:
+                hook(operation, item, elapsed)
+
+    def get(self, context, item):
+        """
+        Return item of context (same as Context.__getitem__)
+        :param context: Context
+        :param item: dotted item
+        :return:
+        """
+        start = self.timer()
+        parsed = context._parse_path(item)
+        return self.get_parts(context, parsed, start)
+
+    def get_parts(self, context, parsed, start=None):
+        """
+        Return item of context by already parsed parts (same as Context._get_parts)
+        :param context: Context
+        :param parsed: tuple of parts
+        :param start: time when access started (parse phase is measured from it)
+        :return:
+        """
+        timer, timings = self.timer, self._timings
+        parsed_at = timer()
+        if start is not None:
+            timings['parse'] += parsed_at - start
+        else:
+            start = parsed_at
+
+        if parsed:
+            context, parsed = _root(context, parsed)
+
+        resolver = _TimedResolver(context._memo, timer)
+        try:
+            if not parsed:
+                raise KeyError('no key provided')
+            value = _lookup(context._data, parsed, resolver)
+        except KeyError:
+            operation = 'miss'
+            raise
+        else:
+            operation = 'get'
+        finally:
+            end = timer()
+            timings['resolve'] += resolver.elapsed
+            timings['traverse'] += end - parsed_at - resolver.elapsed
+            self._record(operation, parsed, end - start)
+
+        return value
+
+    def set(self, context, item, value):
+        """
+        Set item of context (same as Context.__setitem__)
+        :param context: Context
+        :param item: dotted item
+        :param value: value
+        :return:
+        """
+        start = self.timer()
+        parsed = context._parse_path(item)
+
+        if not parsed:
+            raise NameError("Item name not given")
+
+        self.set_parts(context, parsed, value, start)
+
+    def set_parts(self, context, parsed, value, start=None):
+        """
+        Set item of context by already parsed parts (same as Context._set_parts)
+        :param context: Context
+        :param parsed: tuple of parts
+        :param value: value
+        :param start: time when access started (parse phase is measured from it)
+        :return:
+        """
+        timer, timings = self.timer, self._timings
+        parsed_at = timer()
+        if start is not None:
+            timings['parse'] += parsed_at - start
+        else:
+            start = parsed_at
+
+        context, parsed = _root(context, parsed)
+
+        try:
+            context._set_parts(parsed, value)
+        finally:
+            end = timer()
+            timings['build'] += end - parsed_at
+            self._record('set', parsed, end - start)
+
+    def delete(self, context, item):
+        """
+        Delete item of context (same as Context.__delitem__)
+        :param context: Context
+        :param item: dotted item
+        :return:
+        """
+        start = self.timer()
+        parsed = context._parse_path(item)
+        self.delete_parts(context, parsed, start)
+
+    def delete_parts(self, context, parsed, start=None):
+        """
+        Delete item of context by already parsed parts (same as Context._del_parts)
+        :param context: Context
+        :param parsed: tuple of parts
+        :param start: time when access started (parse phase is measured from it)
+        :return:
+        """
+        timer, timings = self.timer, self._timings
+        parsed_at = timer()
+        if start is not None:
+            timings['parse'] += parsed_at - start
+        else:
+            start = parsed_at
+
+        if parsed:
+            context, parsed = _root(context, parsed)
+
+        try:
+            context._del_parts(parsed)
+        except KeyError:
+            operation = 'miss'
+            raise
+        else:
+            operation = 'delete'
+        finally:
+            end = timer()
+            timings['traverse'] += end - parsed_at
+            self._record(operation, parsed, end - start)
+
+    def contains(self, context, item):
+        """
+        Return whether item exists in context (same as Context.__contains__), counted as get or miss
+        :param context: Context
+        :param item: dotted item
+        :return: bool
+        """
+        timer, timings = self.timer, self._timings
+        start = timer()
+        parsed = context._parse_path(item)
+        parsed_at = timer()
+        timings['parse'] += parsed_at - start
+
+        if parsed:
+            context, parsed = _root(context, parsed)
+
+        found = context._contains_parts(parsed)
+
+        end = timer()
+        timings['traverse'] += end - parsed_at
+        self._record('get' if found else 'miss', parsed, end - start)
+        return found
+
+    def record_many(self, context, operations, start, parsed_at, phase, resolved=0.0):
+        """
+        Record bulk operation (get_many/set_many/delete_many), time is split evenly between items
+        :param context: Context (parts of view are recorded relative to its root context)
+        :param operations: list of (operation, parts) tuples
+        :param start: time when operation started
+        :param parsed_at: time when items were parsed
+        :param phase: phase of the rest of operation
+        :param resolved: time spent in callables (part of phase time that is measured as resolve)
+        :return:
+        """
+        end = self.timer()
+        self._timings['parse'] += parsed_at - start
+        self._timings[phase] += end - parsed_at - resolved
+        self._timings['resolve'] += resolved
+
+        prefix = _root(context, ())[1]
+        elapsed = (end - start) / len(operations) if operations else 0.0
+        for operation, parts in operations:
+            self._record(operation, prefix + tuple(parts), elapsed)
+
+    def snapshot(self):
+        """
+        Return snapshot of stats
+        :return: dict with "items" (item => operation => count), "totals" (operation => count) and "timings"
+                 (phase => seconds)
+        """
+        items = {}
+        totals = dict.fromkeys(self.OPERATIONS, 0)
+
+        for parsed, counters in six.iteritems(self._counters):
+            items['.'.join([str(part) for part in parsed])] = dict(zip(self.OPERATIONS, counters))
+            for operation, count in zip(self.OPERATIONS, counters):
+                totals[operation] += count
+
+        return {
+            'items': items,
+            'totals': totals,
+            'timings': dict(self._timings),
+        }
+
+
+class Journal(object):
+    """
+    Journal
+
+    journal of items changed by context. Every item is kept only once (with sequence number of its last change), so
+    size of journal is proportional to number of changed items, not to number of changes. Items are recorded so their
+    current value describes the change: changes that shift or grow lists (or replace containers) are recorded as
+    change of whole list (container).
+    """
+
+    def __init__(self):
+        # parts => sequence number of last change (ordered by sequence number)
+        self._entries = OrderedDict()
+        self._sequence = 0
+        # entries before this sequence number were compacted
+        self._start = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, parts):
+        """
+        Record change of item
+        :param parts: tuple of parts
+        :return:
+        """
+        self._sequence += 1
+        self._entries.pop(parts, None)
+        self._entries[parts] = self._sequence
+
+    def record_set(self, data, parsed):
+        """
+        Record item that will be set (must be called before it's set), see changed.
+        :param data: data of context
+        :param parsed: tuple of parts
+        :return:
+        """
+        self.record(self.changed(data, parsed))
+
+    @staticmethod
+    def changed(data, parsed):
+        """
+        Return parts to be recorded when item is set (must be called before it's set, record them after set succeeds).
+        Data are checked, so if list will grow or container will be replaced (or created), whole list (container) is
+        returned.
+        :param data: data of context
+        :param parsed: tuple of parts
+        :return: tuple of parts
+        """
+        node = data
+
+        for i, part in enumerate(parsed):
+            if isinstance(node, dict):
+                try:
+                    node = node[part]
+                except KeyError:
+                    return parsed[:i + 1]
+            elif isinstance(node, _sequences):
+                if not isinstance(part, six.integer_types) or part >= len(node):
+                    return parsed[:i]
+                node = node[part]
+                if node is None:
+                    return parsed[:i + 1]
+            else:
+                return parsed[:i]
+
+        return parsed
+
+    def record_delete(self, parsed):
+        """
+        Record deleted item, deleted list element shifts following elements, so list is recorded.
+        :param parsed: tuple of parts
+        :return:
+        """
+        if len(parsed) > 1 and isinstance(parsed[-1], six.integer_types):
+            parsed = parsed[:-1]
+        self.record(parsed)
+
+    def checkpoint(self, compact=False):
+        """
+        Return token of current state
+        :param compact: forget changes made before checkpoint (older tokens can't be used anymore)
+        :return: token
+        """
+        if compact:
+            self._entries.clear()
+            self._start = self._sequence
+
+        return self._sequence
+
+    def since(self, token=0):
+        """
+        Return items changed since checkpoint, items under other changed item are omitted
+        :param token: token returned by checkpoint
+        :return: list of tuples of parts (sorted)
+        """
+        if token < self._start:
+            raise ValueError('journal was compacted after checkpoint {}'.format(token))
+
+        changed = set()
+        for parts, sequence in reversed(list(self._entries.items())):
+            if sequence <= token:
+                break
+            changed.add(parts)
+
+        return sorted(
+            (parts for parts in changed if not any(parts[:i] in changed for i in range(1, len(parts)))),
+            key=lambda parts: _parts_key((parts,)),
+        )
+
+
+class PathIndex(object):
+    """
+    PathIndex
+
+    index of all paths (dicts/lists and leaves) of context data. Paths are stored in dict (membership) and in sorted
+    list (keys, prefix scans), so they can be answered without walking the data. Index is updated by every change
+    made through context; after changing data directly, Context.reindex must be called.
+    """
+
+    # kinds of nodes
+    LEAF, MAPPING, SEQUENCE = 0, 1, 2
+
+    def __init__(self):
+        # parts => kind
+        self._entries = {}
+        # sorted list of (sort key, parts)
+        self._sorted = []
+
+    @classmethod
+    def _kind(cls, value):
+        if isinstance(value, dict):
+            return cls.MAPPING
+        if isinstance(value, _containers):
+            return cls.SEQUENCE
+        return cls.LEAF
+
+    @staticmethod
+    def _key(parts):
+        return tuple(_part_key(part) for part in parts)
+
+    def _range(self, parts):
+        """
+        Return range of sorted list with parts and all its descendants
+        :param parts: tuple of parts
+        :return: (lo, hi)
+        """
+        key = self._key(parts)
+        lo = bisect.bisect_left(self._sorted, (key,))
+        hi = bisect.bisect_left(self._sorted, (key + ((2,),),), lo)
+        return lo, hi
+
+    def copy(self):
+        new = PathIndex()
+        new._entries = dict(self._entries)
+        new._sorted = list(self._sorted)
+        return new
+
+    def rebuild(self, data):
+        """
+        Rebuild whole index
+        :param data: data of context
+        :return:
+        """
+        self._entries = {}
+        self._sorted = list(self._scan(data, ()))
+
+    def _scan(self, obj, parts):
+        """
+        Yield (sort key, parts) of all descendants of obj in sorted order and add them to entries
+        :param obj: dict/list
+        :param parts: parts of obj
+        :return: generator
+        """
+        entries = self._entries
+        prefix = self._key(parts)
+        stack = [(Context._children(obj, sort=True), parts, prefix)]
+
+        while stack:
+            children, parts, prefix = stack[-1]
+            for key, value in children:
+                child, child_prefix = parts + (key,), prefix + (_part_key(key),)
+                kind = self._kind(value)
+                entries[child] = kind
+                yield child_prefix, child
+                if kind != self.LEAF:
+                    stack.append((Context._children(value, sort=True), child, child_prefix))
+                    break
+            else:
+                stack.pop()
+
+    def refresh(self, data, parts, deleted=False):
+        """
+        Update index after item was set or deleted. Paths that could be changed are found (changed list length
+        changes paths of all its items) and reindexed.
+        :param data: data of context
+        :param parts: tuple of parts
+        :param deleted: whether item was deleted
+        :return:
+        """
+        entries = self._entries
+        last = len(parts) - 1
+        node = data
+        region = parts
+
+        for i, part in enumerate(parts):
+            prefix = parts[:i + 1]
+
+            # list changed its length, all its items must be reindexed
+            if isinstance(node, _sequences) and ((deleted and i == last) or prefix not in entries):
+                region = parts[:i]
+                break
+
+            if i == last:
+                break
+
+            try:
+                node = node[part]
+            except (KeyError, IndexError, TypeError):
+                region = prefix
+                break
+
+            # node was created or replaced
+            if entries.get(prefix) != self._kind(node):
+                region = prefix
+                break
+
+        self._reindex(data, region)
+
+    def _reindex(self, data, parts):
+        """
+        Reindex parts and all its descendants
+        :param data: data of context
+        :param parts: tuple of parts
+        :return:
+        """
+        if not parts:
+            return self.rebuild(data)
+
+        lo, hi = self._range(parts)
+        for _, removed in self._sorted[lo:hi]:
+            del self._entries[removed]
+
+        node = data
+        try:
+            for part in parts:
+                node = node[part]
+        except (KeyError, IndexError, TypeError):
+            del self._sorted[lo:hi]
+            return
+
+        kind = self._kind(node)
+        self._entries[parts] = kind
+        added = [(self._key(parts), parts)]
+        if kind != self.LEAF:
+            added.extend(self._scan(node, parts))
+
+        self._sorted[lo:hi] = added
+
+    def contains(self, parts):
+        """
+        Return whether parts are in index. None is returned if it can't be decided by index (value is behind object
+        or callable that is not indexed).
+        :param parts: tuple of parts
+        :return: bool or None
+        """
+        if parts in self._entries:
+            return True
+
+        for i in range(len(parts) - 1, 0, -1):
+            kind = self._entries.get(parts[:i])
+            if kind is not None:
+                return None if kind == self.LEAF else False
+
+        return False
+
+    def keys(self, parts=(), item=None, strip=False):
+        """
+        Return sorted keys of all leaves (under given parts)
+        :param parts: tuple of parts
+        :param item: item (as given) used as prefix of keys
+        :param strip: whether to strip item from keys
+        :return: list of keys or None if parts are not in index
+        """
+        entries = self._entries
+
+        if not parts:
+            lo, hi = 0, len(self._sorted)
+        else:
+            kind = entries.get(parts)
+            if kind is None:
+                return None
+            if kind == self.LEAF:
+                return [''] if strip else [item]
+            lo, hi = self._range(parts)
+
+        start = len(parts)
+        prefix = '' if strip or not parts else '{}.'.format(item)
+
+        return [
+            prefix + '.'.join([str(part) for part in found[start:]])
+            for _, found in self._sorted[lo:hi] if entries[found] == self.LEAF
+        ]
+
+
+class Context(object):
+    """
+    Context object
+
+    context is dict-like structure that has custom get/set/del item.
+    """
+
+    _data = None
+
+    # index of paths (PathIndex), None if index is not used
+    _index = None
+
+    # incremented by every change made by context
+    _version = 0
+
+    # cache of results of callable values (Memo), None if callable values are called on every access
+    _memo = None
+
+    # instrumentation of item access (Stats), None if not instrumented
+    _stats = None
+
+    # journal of changed items (Journal), None if changes are not recorded
+    _journal = None
+
+    # nodes owned by this context in copy on write mode (id => node), None if copy on write is not active
+    _owned = None
+
+    # custom dict functionality currently isn't supported
+    dict_ = dict
+
+    # new lists created for index greater or equal to sparse_threshold are SparseList (None means never)
+    sparse_threshold = None
+
+    # callable that returns json string for given value (None means default encoder)
+    encoder = None
+
+    def __init__(self, *args, **kwargs):
+        self.dict_ = kwargs.pop('dict_', self.dict_)
+        self._data = self.dict_()
+
+        for d in args:
+            assert isinstance(d, dict), 'Context init arg must be dictionsry'
+            self.update(d)
+
+        self.update(kwargs)
+
+    @classmethod
+    def new(cls, *args, **settings):
+        """
+        Return context with given options. Keyword arguments of Context() are data, so options are passed here:
+        Context.new({'a': 1}, path_index=True, journal=True)
+        :param args: dicts with data
+        :param settings: dict_, sparse_threshold, encoder, path_index, memoize, memoize_ttl, instrument, journal
+        :return: Context
+        """
+        context = cls(dict_=settings.pop('dict_', cls.dict_))
+        context._configure(args, **settings)
+        return context
+
+    def _configure(self, data=(), sparse_threshold=None, encoder=None, path_index=False, memoize=None,
+                   memoize_ttl=None, instrument=False, journal=False):
+        """
+        Set options of context and update it with given data (see new)
+        :param data: dicts with data
+        :return:
+        """
+        if sparse_threshold is not None:
+            self.sparse_threshold = sparse_threshold
+
+        if encoder is not None:
+            self.encoder = encoder
+
+        for d in data:
+            assert isinstance(d, dict), 'Context init arg must be dictionsry'
+            self.update(d)
+
+        # index is built once all data is set
+        if path_index:
+            self.enable_index()
+
+        if memoize:
+            self.enable_memo(maxsize=MEMO_SIZE if memoize is True else memoize, ttl=memoize_ttl)
+
+        if instrument:
+            self.enable_stats()
+
+        # journal records changes made after context is created
+        if journal:
+            self.enable_journal()
+
+    def enable_index(self):
+        """
+        Enable index of paths. Index is kept up to date by all changes made by context, so "in" and keys() are
+        answered without walking data.
+        :return:
+        """
+        self._index = PathIndex()
+        self._index.rebuild(self._data)
+
+    def disable_index(self):
+        """
+        Disable index of paths
+        :return:
+        """
+        self._index = None
+
+    def reindex(self):
+        """
+        Rebuild index of paths (if enabled), it has to be called after data were changed directly (not by context).
+        :return:
+        """
+        if self._index is not None:
+            self._index.rebuild(self._data)
+
+    def enable_memo(self, maxsize=MEMO_SIZE, ttl=None):
+        """
+        Enable memoization of callable values. Result of callable value is cached (by path) and returned by
+        following accesses, until it expires, it's evicted or path is changed by context (or invalidated).
+        :param maxsize: maximum number of cached results
+        :param ttl: time to live of results in seconds (None means forever)
+        :return:
+        """
+        self._memo = Memo(maxsize=maxsize, ttl=ttl)
+
+    def disable_memo(self):
+        """
+        Disable memoization of callable values
+        :return:
+        """
+        self._memo = None
+
+    def invalidate(self, item=None):
+        """
+        Invalidate memoized results of item (its parents and children), all results are invalidated if item is not
+        given. It has to be called when value of callable changes.
+        :param item: dotted item
+        :return:
+        """
+        if self._memo is not None:
+            self._memo.invalidate(self._parse_path(item) if item is not None else ())
+
+    def enable_stats(self, hooks=None):
+        """
+        Enable instrumentation of item access (__getitem__, __setitem__, __delitem__), see Stats.
+        :param hooks: list of callables hook(operation, item, elapsed) called after every access
+        :return: Stats
+        """
+        self._stats = Stats(hooks=hooks)
+        return self._stats
+
+    def disable_stats(self):
+        """
+        Disable instrumentation of item access
+        :return:
+        """
+        self._stats = None
+
+    def stats(self):
+        """
+        Return snapshot of stats (None if instrumentation is not enabled)
+        :return: dict (see Stats.snapshot)
+        """
+        if self._stats is None:
+            return None
+        return self._stats.snapshot()
+
+    def reset_stats(self):
+        """
+        Reset stats (if instrumentation is enabled)
+        :return:
+        """
+        if self._stats is not None:
+            self._stats.reset()
+
+    def enable_journal(self):
+        """
+        Enable journal of changes. Every change made by context (set, delete, pop, update...) is recorded, so
+        diff of changes since checkpoint can be made.
+        :return:
+        """
+        self._journal = Journal()
+
+    def disable_journal(self):
+        """
+        Disable journal of changes
+        :return:
+        """
+        self._journal = None
+
+    def checkpoint(self, compact=False):
+        """
+        Return token of current state, to be passed to diff
+        :param compact: forget changes made before this checkpoint (older tokens can't be used anymore)
+        :return: token
+        """
+        if self._journal is None:
+            raise ValueError('journal is not enabled')
+        return self._journal.checkpoint(compact=compact)
+
+    def diff(self, since=0, format='dotted'):
+        """
+        Return diff of changes made since checkpoint. Diff is made only from changed items (values are copied).
+        Formats:
+            * dotted - {'set': {item: value}, 'delete': [item]}
+            * json-patch - list of RFC 6902 operations (add, replace, remove)
+        :param since: token returned by checkpoint (0 means all changes since journal was enabled)
+        :param format: dotted or json-patch
+        :return: diff
+        """
+        if self._journal is None:
+            raise ValueError('journal is not enabled')
+        if format not in ('dotted', 'json-patch'):
+            raise ValueError('unknown diff format: {}'.format(format))
+
+        result = {'set': {}, 'delete': []} if format == 'dotted' else []
+
+        for parts in self._journal.since(since):
+            try:
+                value = copy.deepcopy(self._get_parts(parts))
+            except KeyError:
+                found = False
+            else:
+                found = True
+
+            if format == 'dotted':
+                item = '.'.join([str(part) for part in parts])
+                if found:
+                    result['set'][item] = value
+                else:
+                    result['delete'].append(item)
+                continue
+
+            pointer = ''.join(['/' + str(part).replace('~', '~0').replace('/', '~1') for part in parts])
+            if not found:
+                result.append({'op': 'remove', 'path': pointer})
+                continue
+
+            try:
+                parent = self._get_parts(parts[:-1]) if len(parts) > 1 else self._data
+            except KeyError:
+                parent = None
+            op = 'replace' if isinstance(parent, _sequences) else 'add'
+            result.append({'op': op, 'path': pointer, 'value': value})
+
+        return result
+
+    def apply_diff(self, diff):
+        """
+        Apply diff made by diff method (dotted or json-patch format). Items that should be deleted but are not found
+        are ignored.
+        :param diff: diff
+        :return: self
+        """
+        if isinstance(diff, dict):
+            for item in diff.get('delete', ()):
+                try:
+                    del self[item]
+                except KeyError:
+                    pass
+            self.set_many(copy.deepcopy(diff.get('set', {})))
+            return self
+
+        for operation in diff:
+            op = operation['op']
+            parts = tuple(
+                int(part) if part.isdigit() else part.replace('~1', '/').replace('~0', '~')
+                for part in operation['path'].split('/')[1:]
+            )
+
+            if op == 'remove':
+                try:
+                    self._del_parts(parts)
+                except KeyError:
+                    pass
+            elif op in ('add', 'replace'):
+                value = copy.deepcopy(operation['value'])
+                parent = self._get_parts(parts[:-1]) if len(parts) > 1 else self._data
+                if op == 'add' and isinstance(parent, _sequences):
+                    # add to list inserts value (- appends)
+                    values = list(parent)
+                    values.insert(len(values) if parts[-1] == '-' else parts[-1], value)
+                    self._set_parts(parts[:-1], values)
+                else:
+                    self._set_parts(parts, value)
+            else:
+                raise NotImplementedError('json patch operation {} not supported currently'.format(op))
+
+        return self
+
+    def __delitem__(self, item):
+        """
+        Delete item by dotted key
+        :param item:
+        :return:
+        """
+        if self._stats is not None:
+            return self._stats.delete(self, item)
+
+        self._del_parts(self._parse_path(item))
+
+    def _del_parts(self, parsed):
+        """
+        Delete item by already parsed parts
+        :param parsed: tuple of parts
+        :return:
+        """
+        if not parsed:
+            raise KeyError('no key provided')
+
+        if self._owned is not None:
+            self._unshare(parsed)
+
+        actual = self._data
+
+        for i, part in enumerate(parsed):
+
+            is_last = i == len(parsed) - 1
+
+            try:
+                if is_last:
+                    del actual[part]
+                    break
+                actual = actual[part]
+
+            except (KeyError, IndexError):
+                raise KeyError(".".join([str(x) for x in parsed[:i + 1]]))
+
+        self._version += 1
+
+        if self._journal is not None:
+            self._journal.record_delete(parsed)
+
+        if self._memo is not None:
+            self._memo.invalidate(parsed)
+
+        if self._index is not None:
+            self._index.refresh(self._data, parsed, deleted=True)
+
+    def __getitem__(self, item):
+        """
+        Return item
+        :param item: dotted syntax
+        :return:
+        """
+        if self._stats is not None:
+            return self._stats.get(self, item)
+
+        return self._get_parts(self._parse_path(item))
+
+    def _get_parts(self, parsed):
+        """
+        Return item by already parsed parts
+        :param parsed: tuple of parts
+        :return:
+        """
+        if not parsed:
+            raise KeyError('no key provided')
+
+        return _lookup(self._data, parsed, self._memo)
+
+    def __setitem__(self, item, value):
+        """
+        setitem is more complicated one, because it needs to update values if exists, if not create appropriate one.
+        Steps:
+            * split item to parts
+            * start with self._data
+        :param item:
+        :param value:
+        :return:
+        """
+
+        if self._stats is not None:
+            return self._stats.set(self, item, value)
+
+        # get parsed parts of item
+        parsed = self._parse_path(item)
+
+        if not parsed:
+            raise NameError("Item name not given")
+
+        self._set_parts(parsed, value)
+
+    def _set_parts(self, parsed, value):
+        """
+        Set item by already parsed parts
+        :param parsed: tuple of parts
+        :param value:
+        :return:
+        """
+        if self._owned is not None:
+            self._unshare(parsed)
+
+        if self._journal is None:
+            self._build_item(self._data, parsed, value=self._build_value(value))
+        else:
+            # journaled set is atomic, so journal never records change that did not happen
+            changed = self._journal.changed(self._data, parsed)
+            undo = []
+            try:
+                self._build_item(self._data, parsed, value=self._build_value(value), undo=undo)
+            except Exception:
+                _rollback(undo)
+                raise
+            self._journal.record(changed)
+
+        self._version += 1
+
+        if self._memo is not None:
+            self._memo.invalidate(parsed)
+
+        if self._index is not None:
+            self._index.refresh(self._data, parsed)
+
+    def _unshare(self, parsed):
+        """
+        Copy on write support. Copies all dict/list nodes on path to given item (that are not owned by this context
+        yet), so they can be safely changed.
+        :param parsed: tuple of parts
+        :return:
+        """
+        owned = self._owned
+        actual = self._data
+
+        for part in parsed[:-1]:
+            try:
+                child = actual[part]
+            except (KeyError, IndexError, TypeError):
+                return
+
+            if not isinstance(child, _sequences + (dict,)):
+                return
+
+            if id(child) not in owned:
+                child = copy.copy(child)
+                actual[part] = child
+                owned[id(child)] = child
+
+            actual = child
+
+        # value on path is going to be replaced or deleted, so its owned nodes are released
+        try:
+            _disown(owned, actual[parsed[-1]])
+        except (KeyError, IndexError, TypeError):
+            pass
+
+    def _build_value(self, value):
+        """
+        Build value builds value. Value is scanned once and changed in place, only keys with dots (or integer keys
+        given as strings) are rebuilt, all other keys and values are kept as they are.
+        :param value:
+        :return:
+        """
+
+        if isinstance(value, dict):
+            rebuild = []
+            for key, item in six.iteritems(value):
+                self._build_value(item)
+                if not _is_plain(key):
+                    rebuild.append(key)
+
+            for key in rebuild:
+                self._build_item(value, self._parse_item(str(key)), value.pop(key))
+
+        elif isinstance(value, list):
+            for item in value:
+                self._build_value(item)
+
+        return value
+
+    def _build_item(self, obj, parts, value=None, undo=None):
+        """
+        Build item in obj, all missing dicts/lists on path are created and value is set.
+        :param obj: dict/list
+        :param parts: list of parts
+        :param value: value to be set
+        :param undo: list where undo records are appended (see _record)
+        :return: obj (value if no parts are given)
+        """
+        if not parts:
+            return value
+
+        node = obj
+        last = len(parts) - 1
+
+        for i in range(last):
+            node = self._descend(node, parts[i], parts[i + 1], undo)
+
+        self._assign(node, parts[last], value, undo)
+
+        return obj
+
+    def _descend(self, obj, part, next_part, undo=None):
+        """
+        Return child of obj by part, prepared for next part (created or replaced if needed)
+        :param obj: dict/list
+        :param part: key or index
+        :param next_part: following part
+        :param undo: list where undo records are appended (see _record)
+        :return: child
+        """
+        if undo is not None:
+            _record(undo, obj, part)
+
+        if isinstance(obj, _sequences):
+            _grow(obj, part)
+            result = obj[part]
+            if result is None:
+                result = self._prepare(next_part)
+                obj[part] = result
+
+        elif isinstance(obj, dict):
+            try:
+                result = obj[part]
+            except KeyError:
+                result = self._prepare(next_part)
+                obj[part] = result
+            else:
+                if isinstance(next_part, six.integer_types):
+                    # dict with integer keys is kept
+                    if not isinstance(result, _sequences + (dict,)):
+                        result = self._prepare(next_part)
+                        obj[part] = result
+                elif not isinstance(result, dict):
+                    result = self.dict_()
+                    obj[part] = result
+
+        else:
+            raise NotImplementedError('settings of obj not supported currently')
+
+        return result
+
+    def _assign(self, obj, part, value, undo=None):
+        """
+        Set value in obj by part
+        :param obj: dict/list
+        :param part: key or index
+        :param value: value to be set
+        :param undo: list where undo records are appended (see _record)
+        :return:
+        """
+        if undo is not None:
+            _record(undo, obj, part)
+
+        if isinstance(obj, _sequences):
+            _grow(obj, part)
+        elif not isinstance(obj, dict):
+            raise NotImplementedError('settings of obj not supported currently')
+
+        obj[part] = value
+
+    def _build_many(self, items, undo=None):
+        """
+        Build multiple items, items must be sorted by parts so common prefix of following items is walked only once.
+        :param items: sorted list of (parts, value) tuples, values must be already built
+        :param undo: list where undo records are appended (see _record)
+        :return:
+        """
+        # nodes[i] is node for first i parts of previous item
+        nodes = [self._data]
+        previous = ()
+
+        for parts, value in items:
+            if not parts:
+                raise KeyError('no key provided')
+
+            common = 0
+            limit = min(len(parts) - 1, len(nodes) - 1)
+            while common < limit and parts[common] == previous[common]:
+                common += 1
+
+            # node prepared for integer part (list) cannot be reused for string part
+            if common and isinstance(nodes[common], _sequences) and \
+                    not isinstance(parts[common], six.integer_types):
+                common -= 1
+
+            del nodes[common + 1:]
+            node = nodes[common]
+
+            for i in range(common, len(parts) - 1):
+                node = self._descend(node, parts[i], parts[i + 1], undo)
+                nodes.append(node)
+
+            self._assign(node, parts[-1], value, undo)
+            previous = parts
+
+    def _prepare(self, part):
+        """
+        Return new empty dict/list for given part
+        :param part: key or index
+        :return:
+        """
+        if isinstance(part, six.integer_types):
+            if self.sparse_threshold is not None and part >= self.sparse_threshold:
+                return SparseList()
+            return []
+
+        return self.dict_()
+
+    @property
+    def data(self):
+        """
+        Property for data
+        :return:
+        """
+        return self._data
+
+    def dumps(self, item=None, **kwargs):
+        """
+        Dumps returns json string for given item. If no item is given whole dict is returned.
+        Without kwargs encoder of context is used (json.dumps by default), otherwise json.dumps with kwargs.
+        :param item: item name such as 'result.0.user'
+        :param kwargs: additional kwargs passed to json.dumps
+        :return: json string
+        """
+        target = self._dump_target(item)
+
+        if kwargs:
+            kwargs.setdefault('default', _json_default)
+            return json.dumps(target, **kwargs)
+
+        return (self.encoder or default_encoder)(target)
+
+    def iterdumps(self, item=None, **kwargs):
+        """
+        Iterdumps yields json string for given item in chunks, so whole string is never built. Chunks are always
+        produced by pure python json.JSONEncoder (encoder of context is not used), which is several times slower than
+        dumps.
+        :param item: item name such as 'result.0.user'
+        :param kwargs: additional kwargs passed to json.JSONEncoder
+        :return: generator of strings
+        """
+        target = self._dump_target(item)
+        kwargs.setdefault('default', _json_default)
+        return json.JSONEncoder(**kwargs).iterencode(target)
+
+    def dump(self, fp, item=None, chunk_size=65536, stream=False, **kwargs):
+        """
+        Dump writes json for given item to file like object. By default json is built by dumps (encoder of context is
+        used) and written at once, with stream=True it's written in chunks of (at least) chunk_size characters
+        produced by iterdumps (whole string is never built, but encoding is slower).
+        :param fp: file like object (opened in text mode)
+        :param item: item name such as 'result.0.user'
+        :param chunk_size: size of chunk written at once (stream only)
+        :param stream: whether to write json in chunks
+        :param kwargs: additional kwargs passed to json.dumps (json.JSONEncoder if stream is True)
+        :return:
+        """
+        if not stream:
+            fp.write(self.dumps(item, **kwargs))
+            return
+
+        chunks = []
+        size = 0
+
+        for chunk in self.iterdumps(item, **kwargs):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= chunk_size:
+                fp.write(''.join(chunks))
+                chunks, size = [], 0
+
+        if chunks:
+            fp.write(''.join(chunks))
+
+    def _dump_target(self, item):
+        """
+        Return value to be dumped, lookup is read only (None for missing item)
+        :param item: item name
+        :return:
+        """
+        if not item:
+            return self._data
+
+        try:
+            return self[item]
+        except KeyError:
+            return None
+
+    def copy(self, cow=False):
+        """
+        Copy performs deep copy of underlying _data and returns context with this _data
+        :param cow: copy on write - data is not copied, both contexts share all nodes and dict/list nodes are copied
+        only when they are changed (on path of __setitem__/__delitem__)
+        :return:
+        """
+        if not cow:
+            new = Context.new(copy.deepcopy(self._data), path_index=self._index is not None, **self._settings())
+        else:
+            new = self._new(copy.copy(self._data))
+            new._owned = {id(new._data): new._data}
+            if self._index is not None:
+                new._index = self._index.copy()
+
+            # all nodes are now shared, so this context must copy them on write as well
+            self._owned = {id(self._data): self._data}
+
+        # memoized results are not shared (callables of copy may be changed independently)
+        if self._memo is not None:
+            new._memo = self._memo.copy()
+
+        return new
+
+    @classmethod
+    def from_data(cls, data, expand_dots=True, **kwargs):
+        """
+        Return context that uses given data as they are (data are not copied).
+        If expand_dots is True, data is scanned once and only dicts that have keys with dots are rebuilt (in place),
+        otherwise data is used untouched.
+        :param data: dict
+        :param expand_dots: whether to expand keys with dots
+        :param kwargs: passed to Context.new (e.g. dict_)
+        :return: Context
+        """
+        assert isinstance(data, dict), 'Context data must be dictionary'
+
+        context = cls.new(**kwargs)
+        context._data = context._build_value(data) if expand_dots else data
+        context.reindex()
+        return context
+
+    @classmethod
+    def from_flat(cls, mapping, **kwargs):
+        """
+        Return context built from flat mapping dotted item => value. Items are sorted and built in one pass, so
+        common prefix of following items is walked only once.
+        :param mapping: flat dict
+        :param kwargs: passed to Context.new (e.g. dict_)
+        :return: Context
+        """
+        context = cls.new(**kwargs)
+
+        items = sorted(((_split(str(key)), context._build_value(value)) for key, value in six.iteritems(mapping)),
+                       key=_parts_key)
+        context._build_many(items)
+
+        context.reindex()
+        return context
+
+    @classmethod
+    def load(cls, source, lazy=False, mmap=False, **kwargs):
+        """
+        Load context from json file.
+        If lazy is True, json objects are only indexed and values are parsed when they are accessed for the first
+        time (keys with dots are not expanded then).
+        :param source: path or file like object
+        :param lazy: whether to parse values on demand
+        :param mmap: whether to map file to memory instead of reading it (lazy only)
+        :param kwargs: passed to Context.new (e.g. dict_)
+        :return: Context
+        """
+        if lazy:
+            return cls.from_data(_lazy.load(source, use_mmap=mmap), expand_dots=False, **kwargs)
+
+        if isinstance(source, six.string_types):
+            with open(source) as fp:
+                return cls.from_data(json.load(fp), **kwargs)
+
+        return cls.from_data(json.load(source), **kwargs)
+
+    def freeze(self, name=None):
+        """
+        Freeze data to read-only context stored in shared memory block, other processes can attach to it by name
+        (see SharedContext).
+        :param name: name of shared memory block (random name if not given)
+        :return: SharedContext
+        """
+        # imported here since shared module imports context
+        from .shared import SharedContext
+        return SharedContext.create(self, name=name, **self._settings())
+
+    @classmethod
+    def load_snapshot(cls, source, mmap=False, lazy=True, **kwargs):
+        """
+        Load context from binary snapshot (see save_snapshot).
+        If lazy is True, large dicts are decoded when they are accessed for the first time, with mmap only touched
+        parts of file are read.
+        :param source: path or file like object (binary)
+        :param mmap: whether to map file to memory instead of reading it (ignored for compressed snapshot)
+        :param lazy: whether to decode large dicts on demand
+        :param kwargs: passed to Context.new (e.g. dict_)
+        :return: Context
+        """
+        return cls.from_data(_snapshot.load(source, use_mmap=mmap, lazy=lazy), expand_dots=False, **kwargs)
+
+    def save_snapshot(self, fp, compress=False):
+        """
+        Save data to binary snapshot. Snapshot keeps integer keys, tuples and SparseLists, dict keys are stored only
+        once. Values must be None, bool, int, float, string, bytes or containers of them.
+        :param fp: path or file like object (binary)
+        :param compress: whether to compress snapshot (zlib)
+        :return:
+        """
+        _snapshot.dump(self._data, fp, compress=compress)
+
+    def to_flat(self, item=None, sort=False):
+        """
+        Return flat dict dotted item => value of all leaves (single pass walk), empty dicts/lists are not included.
+        :param item: item to start with
+        :param sort: whether to sort keys
+        :return: dict
+        """
+        return self.dict_(self.walk(item=item, sort=sort))
+
+    def _new(self, data):
+        """
+        Return new context with same settings, that uses given data as they are (no copy, no build)
+        :param data: dict
+        :return: Context
+        """
+        new = Context.new(**self._settings())
+        new._data = data
+        return new
+
+    def _settings(self):
+        """
+        Return settings of context (passed to new contexts)
+        :return: dict
+        """
+        return {
+            'dict_': self.dict_,
+            'sparse_threshold': self.sparse_threshold,
+            'encoder': self.encoder,
+        }
+
+    def view(self, item):
+        """
+        Return view of item (dict or list), that is context rooted at item sharing data with this context.
+        :param item: dotted item
+        :return: ContextView
+        """
+        return ContextView(self, item)
+
+    def aget(self, item):
+        """
+        Return coroutine that resolves item, awaitables and coroutine functions on path are awaited (python 3 only).
+        Results replace lazy values in data, so every lazy value is awaited only once.
+        :param item: dotted item
+        :return: coroutine
+        """
+        # aio is imported here since it uses python 3 syntax
+        from . import aio
+        return aio.aget(self, item)
+
+    def resolve(self, items):
+        """
+        Return coroutine that resolves multiple items concurrently (see aget)
+        :param items: iterable of dotted items
+        :return: coroutine that returns list of values
+        """
+        from . import aio
+        return aio.resolve(self, items)
+
+    def get(self, item, default=None):
+        """
+        If not found return/set default value
+        :param item: dotted syntax item
+        :param default: default value
+        :return:
+        """
+
+        try:
+            return self[item]
+        except KeyError:
+            self[item] = default
+
+        return default
 
-    # custom dict functionality currently isn't supported
-    dict_ = dict
+    def pop(self, item, default=None):
+        """
+        Pops item from context
+        :param item:
+        :param default:
+        :return:
+        """
 
-    def __init__(self, *args, **kwargs):
-        self.dict_ = kwargs.pop('dict_', self.dict_)
-        self._data = self.dict_()
+        try:
+            result = self[item]
+        except KeyError:
+            result = default
 
-        for d in args:
-            assert isinstance(d, dict), 'Context init arg must be dictionsry'
-            self.update(d)
+        try:
+            del self[item]
+        except KeyError:
+            pass
 
-        self.update(kwargs)
+        return result
 
-    def __delitem__(self, item):
+    def get_many(self, items, default=None):
         """
-        Delete item by dotted key
-        :param item:
-        :return:
+        Return values of multiple items, items are walked in sorted order so common prefix is resolved only once.
+        :param items: iterable of dotted items
+        :param default: value returned for items that are not found
+        :return: list of values (in order of items)
         """
-        parsed = self._parse_item(item)
-        if not parsed:
-            raise KeyError('no key provided')
+        stats = self._stats
+        if stats is not None:
+            start = stats.timer()
 
-        actual = self._data
+        parsed = [self._parse_path(item) for item in items]
+        result = [default] * len(parsed)
 
-        for i, part in enumerate(parsed):
+        memo = self._memo
+        if stats is not None:
+            parsed_at = stats.timer()
+            memo = _TimedResolver(memo, stats.timer)
+            found = [False] * len(parsed)
 
-            is_last = i == len(parsed) - 1
+        # nodes[i] is value for first i parts of previous item
+        nodes = [self._data]
+        previous = ()
+
+        for position, parts in sorted(enumerate(parsed), key=lambda item: _parts_key((item[1],))):
+            if not parts:
+                continue
+
+            common = 0
+            limit = min(len(parts), len(nodes) - 1)
+            while common < limit and parts[common] == previous[common]:
+                common += 1
+
+            del nodes[common + 1:]
+            previous = parts
 
             try:
-                if is_last:
-                    del actual[part]
-                    return
-                actual = actual[part]
+                for i in range(common, len(parts)):
+                    nodes.append(_lookup(nodes[i], parts[i:i + 1], memo, parts[:i]))
+            except KeyError:
+                continue
 
-            except (KeyError, IndexError):
-                raise KeyError(".".join([str(x) for x in parsed[:i + 1]]))
+            result[position] = nodes[-1]
+            if stats is not None:
+                found[position] = True
 
-    def __getitem__(self, item):
+        if stats is not None:
+            operations = [('get' if hit else 'miss', parts) for hit, parts in zip(found, parsed)]
+            stats.record_many(self, operations, start, parsed_at, 'traverse', memo.elapsed)
+
+        return result
+
+    def set_many(self, mapping):
         """
-        Return item
-        :param item: dotted syntax
+        Set multiple items at once. Items are built in sorted order (so common prefix is walked only once and shorter
+        item is set before longer one). Set is atomic, if any item fails nothing is changed.
+        :param mapping: dict (or iterable of pairs) dotted item => value
         :return:
         """
-        parsed = self._parse_item(item)
-        if not parsed:
-            raise KeyError('no key provided')
-
-        actual = self._data
-        for i, part in enumerate(parsed):
-            try:
-                actual = actual[part]
-            except TypeError:
-                actual = getattr(actual, part)
-            except (KeyError, IndexError):
-                raise KeyError(".".join([str(x) for x in parsed[:i + 1]]))
+        pairs = six.iteritems(mapping) if isinstance(mapping, dict) else mapping
 
-            while callable(actual):
-                actual = actual()
+        stats = self._stats
+        if stats is None:
+            self._set_many([(self._parse_path(item), self._build_value(value)) for item, value in pairs])
+            return
 
-        return actual
+        start = stats.timer()
+        parsed = [(self._parse_path(item), value) for item, value in pairs]
+        parsed_at = stats.timer()
+        try:
+            self._set_many([(parts, self._build_value(value)) for parts, value in parsed])
+        finally:
+            stats.record_many(self, [('set', parts) for parts, _ in parsed], start, parsed_at, 'build')
 
-    def __setitem__(self, item, value):
+    def _set_many(self, items):
         """
-        setitem is more complicated one, because it needs to update values if exists, if not create appropriate one.
-        Steps:
-            * split item to parts
-            * start with self._data
-        :param item:
-        :param value:
+        Set multiple items by already parsed parts
+        :param items: list of (parts, value) tuples (values must be already built)
         :return:
         """
+        if self._owned is not None:
+            for parsed, _ in items:
+                self._unshare(parsed)
 
-        # get parsed parts of item
-        parsed = self._parse_item(str(item))
+        items.sort(key=_parts_key)
 
-        if not parsed:
-            raise NameError("Item name not given")
+        if self._journal is not None:
+            changed = [self._journal.changed(self._data, parsed) for parsed, _ in items]
+
+        undo = []
+        try:
+            self._build_many(items, undo)
+        except Exception:
+            _rollback(undo)
+            raise
 
-        # copy to new list
-        parts = parsed[:]
-        self._build_item(self._data, parts, value=self._build_value(value))
+        if self._journal is not None:
+            for parts in changed:
+                self._journal.record(parts)
 
-    def _build_value(self, value):
+        self._version += 1
+
+        if self._memo is not None:
+            for parsed, _ in items:
+                self._memo.invalidate(parsed)
+
+        if self._index is not None:
+            for parsed, _ in items:
+                self._index.refresh(self._data, parsed)
+
+    def delete_many(self, items):
         """
-        Build value builds value.
-        :param value:
+        Delete multiple items at once. All items refer to data before delete (list indexes are not shifted by
+        previous deletes). Delete is atomic, if any item is not found, KeyError is raised and nothing is deleted.
+        :param items: iterable of dotted items
         :return:
         """
+        stats = self._stats
+        if stats is None:
+            self._delete_many(set(self._parse_path(item) for item in items))
+            return
+
+        start = stats.timer()
+        parsed = set(self._parse_path(item) for item in items)
+        parsed_at = stats.timer()
+        try:
+            self._delete_many(parsed)
+        except KeyError:
+            # nothing was deleted, only missing items are recorded
+            missing = [('miss', parts) for parts in parsed if not self._contains_parts(parts)]
+            stats.record_many(self, missing, start, parsed_at, 'traverse')
+            raise
+        stats.record_many(self, [('delete', parts) for parts in parsed], start, parsed_at, 'traverse')
 
-        if isinstance(value, dict):
-            for key in value.keys():
-                tmp = value.pop(key)
-                newvalue = self._build_value(tmp)
-                parsed = self._parse_item(str(key))
-                self._build_item(value, parsed, newvalue)
-        if isinstance(value, list):
-            for i, v in enumerate(value):
-                value[i] = self._build_value(v)
-
-        return value
-
-    def _build_item(self, obj, parts, value=None):
+    def _delete_many(self, parsed):
         """
-        Get item
-        :param obj:
-        :param parts:
+        Delete multiple items by already parsed parts
+        :param parsed: iterable of unique tuples of parts
         :return:
         """
-        if not parts:
-            return value
+        parsed = sorted(parsed, key=lambda parts: _parts_key((parts,)))
 
-        part = parts.pop(0)
+        if self._owned is not None:
+            for parts in parsed:
+                self._unshare(parts)
 
-        try:
-            next_part = parts[0]
-        except IndexError:
-            next_part = None
-
-        def prepare_list(l, index):
-            """
-            Prepare list updates length of list (inplace and also returns)
-            :param l: list
-            :param index: index to be used
-            :return: list
-            """
-            if len(l) < index + 1:
-                for i in range(index + 1):
-                    try:
-                        l[i]
-                    except:
-                        l.append(None)
-            return l
-
-        def prepare_next(n):
-            """
-            Prepare nex value by part
-            :param n: part
-            :return:
-            """
-            if isinstance(n, (int,)):
-                new_item = prepare_list([], n)
-            else:
-                new_item = self.dict_()
-            return self._build_item(new_item, parts, value=value)
+        # find containers first, so nothing is deleted if any item is missing
+        found = []
+        nodes = [self._data]
+        previous = ()
 
-        if isinstance(obj, list):
-            # Handling list
-            try:
-                result = obj[part]
-                if result is None:
-                    # look at next part
-                    result = prepare_next(next_part)
-                else:
-                    obj[part] = self._build_item(result, parts, value=value)
-            except IndexError:
-                prepare_list(obj, part)
+        for parts in parsed:
+            if not parts:
+                raise KeyError('no key provided')
 
-                # look at next part
-                result = prepare_next(next_part)
+            common = 0
+            limit = min(len(parts) - 1, len(nodes) - 1)
+            while common < limit and parts[common] == previous[common]:
+                common += 1
 
-            obj[part] = result
+            del nodes[common + 1:]
+            previous = parts
 
-        elif isinstance(obj, dict):
+            for i in range(common, len(parts) - 1):
+                try:
+                    nodes.append(nodes[i][parts[i]])
+                except (KeyError, IndexError, TypeError):
+                    raise KeyError(".".join([str(x) for x in parts[:i + 1]]))
+
+            container, part = nodes[-1], parts[-1]
             try:
-                result = obj[part]
+                container[part]
+            except (KeyError, IndexError, TypeError):
+                raise KeyError(".".join([str(x) for x in parts]))
 
-                # check list length!!
-                if isinstance(next_part, (int,)):
-                    prepare_list(result, next_part)
-                else:
-                    # check item in dictionary
-                    if not isinstance(result, dict):
-                        result = self.dict_()
+            found.append((container, part))
 
-                obj[part] = self._build_item(result, parts, value=value)
-            except KeyError:
-                obj[part] = prepare_next(next_part)
+        # reverse order deletes children before parents and higher list indexes first
+        for container, part in reversed(found):
+            del container[part]
 
-        else:
-            raise NotImplementedError('settings of obj not supported currently')
+        self._version += 1
 
-        return obj
+        if self._journal is not None:
+            for parts in parsed:
+                self._journal.record_delete(parts)
 
-    @property
-    def data(self):
-        """
-        Property for data
-        :return:
-        """
-        return self._data
+        if self._memo is not None:
+            for parts in parsed:
+                self._memo.invalidate(parts)
 
-    def dumps(self, item=None, **kwargs):
+        if self._index is not None:
+            for parts in reversed(parsed):
+                self._index.refresh(self._data, parts, deleted=True)
+
+    def column(self, item, field, dtype=None, default=None, strict=False):
         """
-        Dumps returns json string for given item. If no item is given whole dict is returned
-        :param item: item name such as 'result.0.user'
-        :param kwargs: additional kwargs passed to json.dumps
-        :return: json string
+        Return value of field of every element of list item in single pass (item and field are parsed only once).
+        :param item: item of list such as 'results'
+        :param field: item relative to every element such as 'metrics.latency'
+        :param dtype: None returns list, single character typecode (e.g. 'd') returns array.array, any other dtype
+                      returns numpy array (numpy must be installed)
+        :param default: value used for elements where field is missing
+        :param strict: if True, KeyError is raised for missing field instead of using default
+        :return: list, array.array or numpy.ndarray
         """
-        target = self._data
-        if item:
-            target = self.get(item, default=None)
+        records = self[item]
+        if not isinstance(records, _sequences + (tuple,)):
+            raise TypeError('column item must be list: {}'.format(item))
 
-        return json.dumps(target, **kwargs)
+        base = self._parse_path(item)
+        parsed = self._parse_path(field)
+        memo = self._memo
+        values = []
+        append = values.append
 
-    def copy(self):
+        for index, record in enumerate(records):
+            try:
+                append(_lookup(record, parsed, memo, base + (index,)))
+            except KeyError:
+                if strict:
+                    raise KeyError('{}.{}.{}'.format(item, index, field))
+                append(default)
+
+        if dtype is None:
+            return values
+
+        if isinstance(dtype, six.string_types) and len(dtype) == 1:
+            return array.array(str(dtype), values)
+
+        # numpy is imported only when needed, since import itself is expensive
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError('numpy is required for dtype {!r}'.format(dtype))
+
+        return numpy.asarray(values, dtype=dtype)
+
+    def set_column(self, item, field, values):
         """
-        Copy performs deep copy of underlying _data and returns context with this _data
+        Set field of every element of list item to given values (bulk version of column). List and elements are
+        created if they don't exist (value that is not list is replaced by list), TypeError is raised for dict.
+        :param item: item of list such as 'results'
+        :param field: item relative to every element such as 'metrics.latency'
+        :param values: iterable of values (list, array.array, numpy array...)
         :return:
         """
-        return Context(copy.deepcopy(self._data), dict_=self.dict_)
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
 
-    def get(self, item, default=None):
+        self._set_column(self._parse_path(item), self._parse_path(field), values)
+
+    def _set_column(self, parsed, field, values):
         """
-        If not found return/set default value
-        :param item: dotted syntax item
-        :param default: default value
+        Set column by already parsed item and field
+        :param parsed: tuple of parts of list
+        :param field: tuple of parts of field
+        :param values: iterable of values
         :return:
         """
-
         try:
-            return self[item]
+            records = self._get_parts(parsed)
         except KeyError:
-            self[item] = default
+            records = None
 
-        return default
+        if isinstance(records, dict):
+            raise TypeError('{} is not a list'.format('.'.join([str(part) for part in parsed])))
 
-    def pop(self, item, default=None):
-        """
-        Pops item from context
-        :param item:
-        :param default:
-        :return:
-        """
+        # missing item (or value that is not list) is replaced by new list
+        replace = not isinstance(records, _sequences)
 
-        try:
-            result = self[item]
-        except KeyError:
-            result = default
+        # copy on write and index need to see every single item (set_many is atomic as well)
+        if self._owned is not None or self._index is not None:
+            items = [(parsed, [])] if replace else []
+            items.extend((parsed + (index,) + field, self._build_value(value)) for index, value in enumerate(values))
+            self._set_many(items)
+            return
 
+        # set is atomic, if any value fails all changes are reverted
+        undo = []
         try:
-            del self[item]
-        except KeyError:
-            pass
+            if replace:
+                records = []
+                self._build_item(self._data, parsed, value=records, undo=undo)
 
-        return result
+            for index, value in enumerate(values):
+                self._build_item(records, (index,) + field, value=self._build_value(value), undo=undo)
+        except Exception:
+            _rollback(undo)
+            raise
+
+        self._version += 1
+
+        if self._journal is not None:
+            self._journal.record(parsed)
+
+        if self._memo is not None:
+            self._memo.invalidate(parsed)
 
     def copy_value(self, item=None):
         """
@@ -288,15 +2431,30 @@ class Context(object):
         :param item:
         :return: list of parts
         """
-        result = []
+        return list(_parse(item))
 
-        for part in item.split('.'):
-            try:
-                result.append(int(part))
-            except:
-                result.append(part)
+    @classmethod
+    def _parse_path(cls, item):
+        """
+        Return parsed parts of item as tuple. Parsed items are cached, Accessor returns its precompiled parts.
+        :param item: dotted item or Accessor
+        :return: tuple of parts
+        """
+        if isinstance(item, Accessor):
+            return item.parts
+        if not isinstance(item, six.string_types):
+            item = str(item)
+        return _parse(item)
 
-        return result
+    @classmethod
+    def compile(cls, item):
+        """
+        Compile item into Accessor, which can be reused for get/set/delete without parsing item again.
+        Accessor can be also used instead of item in context[accessor].
+        :param item: dotted item
+        :return: Accessor
+        """
+        return Accessor(item)
 
     def keys(self, item=None, strip=False):
         """
@@ -305,55 +2463,84 @@ class Context(object):
         :param strip: if item is given whether to strip item from keys
         :return:
         """
+        if self._index is not None:
+            result = self._index.keys(() if item is None else self._parse_path(item), item=item, strip=strip)
+            if result is not None:
+                return result
 
-        result = []
-        if item is not None:
-            current, prepend = self[item], True
+        return [key for key, _ in self.walk(item=item, sort=True, strip=strip, resolve=False)]
 
-            # if item is not dict/list/tuple we just return key (found key)
-            if not isinstance(current, (list, tuple, dict)):
-                return [item] if not strip else ['']
+    def walk(self, item=None, sort=False, max_depth=None, strip=False, resolve=True):
+        """
+        Walk data depth first in single pass and yield (key, value) for every leaf.
+        :param item: item to start with (whole data is used if not given)
+        :param sort: whether to sort dict keys (lists are always walked in order)
+        :param max_depth: maximum depth relative to item, deeper dict/list/tuple values are yielded as they are
+        :param strip: if item is given whether to strip item from keys
+        :param resolve: whether to call callable values (same as __getitem__ does)
+        :return: generator of (key, value) tuples
+        """
+        if item is None:
+            current, prefix, parts = self._data, '', ()
         else:
-            current, prepend = self._data, False
-
-        result = sorted(self._list_keys(current))
+            current = self[item]
+            prefix = '' if strip else '{}.'.format(item)
+            parts = self._parse_path(item)
 
-        # prepend item to list or not?
-        if prepend and not strip:
-            """
-            item was given so we should prepend key names with item
-            """
-            for i, value in enumerate(result):
-                result[i] = '.'.join((item, value))
+            # if item is not dict/list/tuple we just return key (found key)
+            if not isinstance(current, _containers) or max_depth == 0:
+                yield ('' if strip else item), current
+                return
 
-        return result
+        for key, value in self._walk(current, prefix, sort=sort, max_depth=max_depth, resolve=resolve, parts=parts):
+            yield key, value
 
-    def _list_keys(self, obj):
+    def _walk(self, obj, prefix, sort=False, max_depth=None, resolve=True, parts=()):
         """
-        Recursively lists keys
-        :param obj: object to be
-        :return:
+        Walk obj iteratively (without recursion), keys are built incrementally from prefix.
+        :param obj: dict/list/tuple to be walked
+        :param prefix: prefix for keys (including trailing dot)
+        :param parts: tuple of parts of obj in data (used as memo key of callable values)
+        :return: generator of (key, value) tuples
         """
+        stack = [(self._children(obj, sort), prefix, 1, parts)]
+        memo = self._memo
+
+        while stack:
+            children, prefix, depth, parts = stack[-1]
+            for name, value in children:
+                key = prefix + str(name)
+                if isinstance(value, _containers) and (max_depth is None or depth < max_depth):
+                    stack.append((self._children(value, sort), key + '.', depth + 1, parts + (name,)))
+                    break
 
-        result = []
+                if resolve and callable(value):
+                    value = _call(value, memo, parts + (name,))
 
-        if isinstance(obj, (dict, list, tuple)):
-            if isinstance(obj, dict):
-                iterable = six.iteritems(obj)
+                yield key, value
             else:
-                iterable = enumerate(obj)
-            for k, v in iterable:
-                if isinstance(v, (list, tuple, dict)):
-                    result += ["{}.{}".format(k, key) for key in self._list_keys(v)]
-                else:
-                    result.append(k)
+                stack.pop()
 
-        return result
+    @staticmethod
+    def _children(obj, sort=False):
+        """
+        Return iterator of (key, value) for dict or list/tuple
+        :param obj: dict/list/tuple
+        :param sort: whether to sort dict keys
+        :return:
+        """
+        if isinstance(obj, dict):
+            if sort:
+                return iter(sorted(six.iteritems(obj), key=_sort_key))
+            return six.iteritems(obj)
+        if isinstance(obj, SparseList):
+            return iter(obj.items())
+        return enumerate(obj)
 
     def items(self, **kwargs):
         """
         Return key/value items (tuple)
-        **kwargs are passed directly to keys method.
+        **kwargs are passed directly to walk method.
         :return:
         """
 
@@ -361,15 +2548,109 @@ class Context(object):
 
     def iteritems(self, **kwargs):
         """
-        Return key/value items (tuple)
-        **kwargs are passed directly to keys method.
+        Return key/value items (tuple) in sorted order
+        **kwargs are passed directly to walk method.
         :return:
         """
+        kwargs.setdefault('sort', True)
+        return self.walk(**kwargs)
+
+    def select(self, pattern, sort=False):
+        """
+        Select all items matching pattern in single traversal, only branches that can match are walked.
+        Pattern is dotted item where part can be:
+            * "*" - matches any key/index
+            * "**" - matches any number of parts (including none)
+            * "start:stop[:step]" - matches list indexes in given slice
+        :param pattern: pattern such as 'users.*.email', 'services.**.port' or 'results.0:10.id'
+        :param sort: whether to sort dict keys
+        :return: generator of (key, value) tuples
+        """
+        parsed = _parse_pattern(pattern)
+
+        # with multiple "**" same item can be matched multiple times
+        seen = set() if parsed.count(DEEP) > 1 else None
+
+        stack = [iter([(self._data, (), 0)])]
+
+        while stack:
+            for obj, parts, position in stack[-1]:
+                if position < len(parsed):
+                    stack.append(self._select_children(obj, parts, parsed, position, sort))
+                    break
+
+                if seen is not None:
+                    if parts in seen:
+                        continue
+                    seen.add(parts)
+
+                if parts:
+                    yield '.'.join([str(part) for part in parts]), obj
+            else:
+                stack.pop()
+
+    def find_all(self, pattern, sort=False):
+        """
+        Return list of all (key, value) tuples matching pattern, see select method.
+        :return:
+        """
+        return list(self.select(pattern, sort=sort))
+
+    def _select_children(self, obj, parts, parsed, position, sort):
+        """
+        Generate next states (obj, parts, position) of select for obj matched by parts[:position]
+        :return: generator of states
+        """
+        part = parsed[position]
+
+        if part == DEEP:
+            # match of no parts first, then descend into every container with same position
+            yield obj, parts, position + 1
+            if isinstance(obj, _containers):
+                for key, value in self._children(obj, sort):
+                    if callable(value):
+                        value = _call(value, self._memo, parts + (key,))
+                    yield value, parts + (key,), position
+            return
+
+        if part == ANY:
+            if isinstance(obj, _containers):
+                for key, value in self._children(obj, sort):
+                    if callable(value):
+                        value = _call(value, self._memo, parts + (key,))
+                    yield value, parts + (key,), position + 1
+            return
+
+        if isinstance(part, slice):
+            if isinstance(obj, SparseList):
+                indexes = six.moves.range(*part.indices(len(obj)))
+                for key, value in obj.items():
+                    if key in indexes:
+                        if callable(value):
+                            value = _call(value, self._memo, parts + (key,))
+                        yield value, parts + (key,), position + 1
+            elif isinstance(obj, (list, tuple)):
+                for key in six.moves.range(*part.indices(len(obj))):
+                    value = obj[key]
+                    if callable(value):
+                        value = _call(value, self._memo, parts + (key,))
+                    yield value, parts + (key,), position + 1
+            return
 
-        for key in self.keys(**kwargs):
-            yield (key, self[key])
+        try:
+            value = obj[part]
+        except TypeError:
+            try:
+                value = getattr(obj, part)
+            except (AttributeError, TypeError):
+                return
+        except (KeyError, IndexError):
+            return
 
-        raise StopIteration
+        if callable(value):
+            value = _call(value, self._memo, parts + (part,))
+
+        yield value, parts + (part,), position + 1
 
     def __contains__(self, key):
         """
@@ -377,13 +2658,30 @@ class Context(object):
         :param key:
         :return:
         """
+        if self._stats is not None:
+            return self._stats.contains(self, key)
+
+        return self._contains_parts(self._parse_path(key))
+
+    def _contains_parts(self, parsed):
+        """
+        Return whether item given by parsed parts exists
+        :param parsed: tuple of parts
+        :return: bool
+        """
+        if self._index is not None:
+            found = self._index.contains(parsed)
+            if found is not None:
+                return found
+
         try:
-            self[str(key)]
+            self._get_parts(parsed)
         except KeyError:
             return False
         return True
 
-    def expand(self, as_context=False):
+    def expand(self, as_context=False, view=False, callback=None, executor=None, workers=None, ordered=True,
+               predicate=None):
         """
         expand
 
@@ -403,6 +2701,12 @@ class Context(object):
 
             '__format__': 'count_me_in_{value}'
 
+        Values listed in `__exclude__` are skipped (both raw and formatted values are checked).
+        If there is `__exclude_if__` key, it's list of dicts item => value (values are compared after format), every
+        combination that matches all values of any of these dicts is skipped:
+
+            '__exclude_if__': [{'range_value': 'ranged_1', 'choice_value': 'b'}]
+
         Example:
 
             _data = {
@@ -427,86 +2731,79 @@ class Context(object):
                 "range_value": 'ranged_1',
                 'choice_value': 'b'
             }]
-        :return: generator of items
+        Expanded data is built from data as template, only dicts/lists on path to expanded values are copied, all other
+        values are shared between expanded items (and context) so don't change them. If view is True, read only
+        mappings are yielded instead of dicts, they don't copy anything at all.
+
+        Result is lazy Expansion, that knows count of combinations and can compute any combination by index:
+
+            expansion = context.expand()
+            len(expansion)
+            expansion[10]
+            list(expansion.slice(10, 20))
+            list(expansion.shard(0, of=4))
+
+        Expanded items can be built and processed in parallel (results are streamed back):
+
+            for result in context.expand(callback=process, workers=4):
+                ...
+
+        :param as_context: yield Context instead of data
+        :param view: yield read only views instead of data
+        :param predicate: called with dict item => value of partial combinations, if it returns False, all combinations
+        starting with this partial combination are skipped
+        :param callback: called for every expanded item (in worker), results are yielded instead of expanded items
+        :param executor: concurrent.futures executor, expanded items are built (and callback called) in its workers
+        :param workers: count of process pool workers (if executor is not given)
+        :param ordered: whether to yield results in order or as they are completed (for executor/workers)
+        :return: Expansion (iterable of items) or generator of results if callback, executor or workers is given
         """
 
         choices = []
         ranges = []
-        other = []
-
-        # find expandable variables, currently detected by __choices__, __range__ keys.
-        for key in self.keys():
-            splitted = key.split('.__choices__.')
-            if len(splitted) > 1 and splitted[0] not in choices:
-                choices.append(splitted[0])
-                continue
-            splitted = key.split('.__range__.')
-            if len(splitted) > 1 and splitted[0] not in ranges:
-                ranges.append(splitted[0])
-                continue
 
-            if '.__format__' not in key:
-                other.append(key)
+        # find expandable variables (slots), currently detected by __choices__, __range__ keys.
+        self._find_expanded(self._data, (), choices, ranges)
 
-        # prepare keys(choices, ranges) and list of expanded values to pass to cartesian product later in the code
-        keys = []
+        # prepare slots (choices, ranges) and list of expanded values to pass to cartesian product later in the code
+        slots = []
         values = []
+        constraints = []
 
         # get values for choices and ranges
-        for item in itertools.chain(choices, ranges):
-            formatter = self.get('{}.__format__'.format(item), None)
-            keys.append(item)
-
-            # all available values for expanded value.
-            tmp_values = []
-
-            # get iterator for either choice or range, otherwise KeyError is raised.
-            try:
-                iterator = self['{}.__choices__'.format(item)]
-            except KeyError:
-                try:
-                    iterator = range(*self['{}.__range__'.format(item)])
-                except KeyError:
-                    raise KeyError('Key not found: {}'.format(item))
-
-            # excluded values
-            try:
-                excluded = self['{}.__exclude__'.format(item)]
-            except KeyError:
-                excluded = []
-
-            # iterate over changes and prepare values
-            for value in iterator:
-
-                # check if value is not excluded
-                if value in excluded:
-                    continue
+        for parts, slot in itertools.chain(choices, ranges):
+            slots.append(parts)
+            values.append(slot_values(slot))
+            constraints.extend(slot.get('__exclude_if__', ()))
 
-                if formatter is not None:
-                    value = str(formatter).format(value=value)
+        # combinations (cartesian product) are computed lazily by expansion
+        expansion = Expansion(self, slots, values, as_context=as_context, view=view, constraints=constraints,
+                              predicate=predicate)
 
-                # check if value is not excluded
-                if value in excluded:
-                    continue
+        if callback is None and executor is None and workers is None:
+            return expansion
 
-                tmp_values.append(value)
+        if executor is None and workers is None:
+            return (callback(item) for item in expansion)
 
-            # add list of values for given key
-            values.append(tmp_values)
+        return expansion.map(callback, executor=executor, workers=workers, ordered=ordered)
 
-        # make all combinations (itertools.product) - cartesian product
-        for combination in list(itertools.product(*values)):
-            # prepare new context
-            new = self.copy()
-
-            # add current combination _data to new context
-            for i, v in enumerate(combination):
-                new[keys[i]] = v
-
-            if as_context:
-                yield Context(new._data)
-            else:
-                yield new._data
+    def _find_expanded(self, obj, parts, choices, ranges):
+        """
+        Find all expanded values (dicts with __choices__ or __range__) in obj
+        :param obj: dict/list
+        :param parts: parts of obj
+        :param choices: list where (parts, slot) of choices are appended
+        :param ranges: list where (parts, slot) of ranges are appended
+        :return:
+        """
+        for key, value in self._children(obj, sort=True):
+            if isinstance(value, dict) and '__choices__' in value:
+                choices.append((parts + (key,), value))
+            elif isinstance(value, dict) and '__range__' in value:
+                ranges.append((parts + (key,), value))
+            elif isinstance(value, (dict, list)):
+                self._find_expanded(value, parts + (key,), choices, ranges)
 
     def update(self, other):
         """
@@ -525,6 +2822,102 @@ class Context(object):
         return self
 
 
+def _root(context, parsed):
+    """
+    Return root context and parts relative to it (views work directly on data of root context)
+    :param context: Context or ContextView
+    :param parsed: tuple of parts
+    :return: (context, parsed)
+    """
+    while isinstance(context, ContextView):
+        parsed = context.prefix + tuple(parsed)
+        context = context.context
+
+    return context, parsed
+
+
+class ContextView(Context):
+    """
+    ContextView
+
+    context rooted at item of other (parent) context. Nothing is copied, view works directly on data of parent.
+    Reads and writes are relative to item, item itself is parsed only once. Writes are made by parent context so
+    copy on write, index etc. of parent are respected.
+    """
+
+    def __init__(self, context, item):
+        self.context = context
+        self.prefix = context._parse_path(item)
+
+        for key, value in six.iteritems(context._settings()):
+            setattr(self, key, value)
+
+        if not isinstance(self._data, _containers):
+            raise TypeError('view item must be dict or list: {}'.format(item))
+
+    @property
+    def _data(self):
+        return self.context._get_parts(self.prefix)
+
+    @property
+    def _version(self):
+        return self.context._version
+
+    @property
+    def _stats(self):
+        # access of view is recorded by stats of root context (with full items)
+        return _root(self, ())[0]._stats
+
+    @_stats.setter
+    def _stats(self, value):
+        _root(self, ())[0]._stats = value
+
+    def __repr__(self):
+        return '{}({!r}, {!r})'.format(self.__class__.__name__, self.context, '.'.join(str(p) for p in self.prefix))
+
+    def _get_parts(self, parsed):
+        if not parsed:
+            raise KeyError('no key provided')
+        return self.context._get_parts(self.prefix + tuple(parsed))
+
+    def _set_parts(self, parsed, value):
+        self.context._set_parts(self.prefix + tuple(parsed), value)
+
+    def _del_parts(self, parsed):
+        if not parsed:
+            raise KeyError('no key provided')
+        self.context._del_parts(self.prefix + tuple(parsed))
+
+    def _set_column(self, parsed, field, values):
+        self.context._set_column(self.prefix + tuple(parsed), field, values)
+
+    def _set_many(self, items):
+        self.context._set_many([(self.prefix + tuple(parsed), value) for parsed, value in items])
+
+    def _delete_many(self, parsed):
+        self.context._delete_many([self.prefix + tuple(parts) for parts in parsed])
+
+    def copy(self, cow=False):
+        """
+        Copy data of view to new context (see Context.copy). Only view of dict can be copied, view of list raises
+        TypeError (use copy_value or copy.deepcopy(view.data) instead).
+        :param cow: copy on write
+        :return: Context
+        """
+        if not isinstance(self._data, dict):
+            raise TypeError('only view of dict can be copied to context: {}'.format(
+                '.'.join(str(p) for p in self.prefix)))
+
+        if cow:
+            # nodes are now shared with parent context as well
+            root = self.context
+            while isinstance(root, ContextView):
+                root = root.context
+            root._owned = {id(root._data): root._data}
+
+        return super(ContextView, self).copy(cow=cow)
+
+
 if __name__ == "__main__":
     class Test(object):
         something = 'else'
@@ -0,0 +1,613 @@
+"""
+Expansion
+
+Lazy result of Context.expand. Combinations are never enumerated up front, every combination has its index in
+cartesian product and is computed directly from it (mixed radix decoding). So expansion can be counted, indexed,
+sliced and split into shards without generating combinations that are not needed.
+
+Data of context is used as template. Paths to expanded values (slots) are found once, so every expanded item costs
+only copying of dicts/lists on these paths (or nothing at all for views), all other values are shared.
+"""
+from __future__ import print_function
+
+import collections
+import copy
+import functools
+import pickle
+import uuid
+
+from six.moves import range
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:  # pragma: no cover
+    from collections import Mapping, Sequence
+
+
+# expansion and function of process pool worker (set by initializer, so they are not sent with every chunk)
+_worker = None
+
+
+# maximum number of (expansion, func) pairs cached by worker of executor given by caller
+SHIPPED_SIZE = 8
+
+# token => (expansion, func) sent to worker of executor given by caller
+_shipped = {}
+
+
+def _init_worker(expansion, func):
+    """
+    Initializer of process pool worker
+    :param expansion: Expansion
+    :param func: callback for every expanded item
+    :return:
+    """
+    global _worker
+    _worker = (expansion, func)
+
+
+def _run_chunk(start, stop, expansion=None, func=None, token=None, payload=None):
+    """
+    Expand combinations in range start-stop (in worker) and call func for every one of them
+    :param start: first index
+    :param stop: last index (not included)
+    :param expansion: Expansion, if not given the one set by initializer (or cached by token) is used
+    :param func: callback
+    :param token: key of (expansion, func) in cache of worker
+    :param payload: pickled (expansion, func), sent only when worker does not have token cached yet
+    :return: list of results or None if token is not cached and payload is not given
+    """
+    if token is not None:
+        try:
+            expansion, func = _shipped[token]
+        except KeyError:
+            if payload is None:
+                return None
+            if len(_shipped) >= SHIPPED_SIZE:
+                _shipped.clear()
+            expansion, func = _shipped[token] = pickle.loads(payload)
+    elif expansion is None:
+        expansion, func = _worker
+
+    if func is None:
+        return list(expansion._iter_range(start, stop))
+
+    return [func(item) for item in expansion._iter_range(start, stop)]
+
+
+class _Excluded(object):
+    """
+    Excluded values, hashable values are checked in set, unhashable ones in list.
+    """
+
+    __slots__ = ('hashable', 'other')
+
+    def __init__(self, values):
+        self.hashable = set()
+        self.other = []
+
+        for value in values:
+            try:
+                self.hashable.add(value)
+            except TypeError:
+                self.other.append(value)
+
+    def __contains__(self, value):
+        try:
+            return value in self.hashable
+        except TypeError:
+            return value in self.other
+
+
+def slot_values(slot):
+    """
+    Return list of all available values for expanded value (dict with __choices__ or __range__ key)
+    :param slot: dict
+    :return: list of values
+    """
+    formatter = slot.get('__format__', None)
+
+    # get iterator for either choice or range
+    if '__choices__' in slot:
+        iterator = slot['__choices__']
+    else:
+        iterator = range(*slot['__range__'])
+
+    # excluded values
+    excluded = _Excluded(slot.get('__exclude__', []))
+
+    result = []
+
+    # iterate over changes and prepare values
+    for value in iterator:
+
+        # check if value is not excluded
+        if value in excluded:
+            continue
+
+        if formatter is not None:
+            value = str(formatter).format(value=value)
+
+            # check if formatted value is not excluded
+            if value in excluded:
+                continue
+
+        result.append(value)
+
+    return result
+
+
+class _Shape(object):
+    """
+    Shape of paths to slots in template. For every dict/list on these paths there is one shape.
+    """
+
+    __slots__ = ('slots', 'children')
+
+    def __init__(self):
+        # key => index of slot
+        self.slots = {}
+        # key => _Shape
+        self.children = {}
+
+    def add(self, parts, index):
+        """
+        Add slot to shape
+        :param parts: parts of slot
+        :param index: index of slot
+        :return:
+        """
+        shape = self
+        for part in parts[:-1]:
+            shape = shape.children.setdefault(part, _Shape())
+        shape.slots[parts[-1]] = index
+
+    def build(self, node, combination, owned=None):
+        """
+        Copy node and all nodes on paths to slots and set values from combination
+        :param node: dict/list from template
+        :param combination: tuple of values
+        :param owned: dict id => node where copied nodes are added (see copy on write of Context)
+        :return: copied node
+        """
+        node = copy.copy(node)
+        if owned is not None:
+            owned[id(node)] = node
+        for key, index in self.slots.items():
+            node[key] = combination[index]
+        for key, shape in self.children.items():
+            node[key] = shape.build(node[key], combination, owned)
+        return node
+
+    def view(self, node, combination):
+        """
+        Return read only view of node with values from combination
+        :param node: dict/list from template
+        :param combination: tuple of values
+        :return: ExpandedMapping or ExpandedSequence
+        """
+        if isinstance(node, dict):
+            return ExpandedMapping(node, self, combination)
+        return ExpandedSequence(node, self, combination)
+
+    def get(self, node, key, combination):
+        """
+        Return value from node by key
+        :param node: dict/list from template
+        :param key: key or index
+        :param combination: tuple of values
+        :return:
+        """
+        if key in self.slots:
+            return combination[self.slots[key]]
+        if key in self.children:
+            return self.children[key].view(node[key], combination)
+        return node[key]
+
+
+class ExpandedMapping(Mapping):
+    """
+    Read only view of expanded dict, nothing is copied.
+    """
+
+    __slots__ = ('_node', '_shape', '_combination')
+
+    def __init__(self, node, shape, combination):
+        self._node = node
+        self._shape = shape
+        self._combination = combination
+
+    def __getitem__(self, key):
+        return self._shape.get(self._node, key, self._combination)
+
+    def __iter__(self):
+        return iter(self._node)
+
+    def __len__(self):
+        return len(self._node)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class ExpandedSequence(Sequence):
+    """
+    Read only view of expanded list, nothing is copied.
+    """
+
+    __slots__ = ('_node', '_shape', '_combination')
+
+    def __init__(self, node, shape, combination):
+        self._node = node
+        self._shape = shape
+        self._combination = combination
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self._node))[index]]
+        if index < 0:
+            index += len(self._node)
+        return self._shape.get(self._node, index, self._combination)
+
+    def __len__(self):
+        return len(self._node)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class Expansion(object):
+    """
+    Expansion of context
+
+    Iterating over expansion yields expanded data (or contexts) in the same order as itertools.product would.
+
+    Combinations can be excluded by constraints (list of dicts item => value, combination that matches all values of
+    any of them is excluded) and by predicate (called with dict item => value of partial combination, returns False
+    to exclude it). Both are checked while combinations are built, so whole excluded branches of cartesian product
+    are skipped at once. Length, indexes, slices and shards then still address all combinations (see size), but
+    excluded combinations are skipped (indexing excluded combination raises IndexError, see count).
+    """
+
+    def __init__(self, context, slots, values, as_context=False, view=False, constraints=None, predicate=None):
+        """
+        :param context: context to be expanded (its data is used as template)
+        :param slots: list of parts of expanded items
+        :param values: list of available values for every expanded item
+        :param as_context: whether to yield Context instead of data
+        :param view: whether to yield read only views instead of data
+        :param constraints: list of dicts item => value of excluded (partial) combinations
+        :param predicate: callable that returns False for excluded (partial) combination
+        """
+        if as_context and view:
+            raise ValueError('view cannot be used together with as_context')
+
+        self.context = context
+        self.keys = ['.'.join(str(part) for part in parts) for parts in slots]
+        self.values = [list(v) for v in values]
+        self.as_context = as_context
+        self.view = view
+
+        # shape of paths to slots, computed once for all combinations
+        self._shape = _Shape()
+        for index, parts in enumerate(slots):
+            self._shape.add(parts, index)
+
+        self._radix = [len(v) for v in self.values]
+
+        # strides[i] is count of combinations with the same digits 0-i
+        self._strides = [1] * len(self._radix)
+        for i in range(len(self._radix) - 2, -1, -1):
+            self._strides[i] = self._strides[i + 1] * self._radix[i + 1]
+
+        # count of all combinations (including excluded ones)
+        self.size = 1
+        for radix in self._radix:
+            self.size *= radix
+
+        # constraints are checked at depth of the last slot they use
+        self.predicate = predicate
+        self._rules = [[] for _ in self._radix]
+        indexes = dict((key, i) for i, key in enumerate(self.keys))
+
+        for constraint in constraints or ():
+            rule = []
+            for key, value in constraint.items():
+                try:
+                    rule.append((indexes[key], value))
+                except KeyError:
+                    raise KeyError('Key not found: {}'.format(key))
+            if rule:
+                self._rules[max(rule)[0]].append(rule)
+
+        self._pruning = predicate is not None or any(self._rules)
+        self._count = None
+
+    def __len__(self):
+        """
+        Return count of all combinations including excluded ones (same as size, so every index in range(len) is
+        valid index, see count for count of combinations that are not excluded)
+        :return:
+        """
+        return self.size
+
+    def count(self):
+        """
+        Return count of combinations that are not excluded (computed, not enumerated if there are no constraints)
+        :return:
+        """
+        if not self._pruning:
+            return self.size
+
+        if self._count is None:
+            self._count = sum(1 for _ in self._iter_digits(0, self.size))
+
+        return self._count
+
+    def __iter__(self):
+        return self._iter_range(0, self.size)
+
+    def __getitem__(self, index):
+        """
+        Return combination at given index (negative indexes are supported)
+        :param index: integer index
+        :return: expanded data (or context)
+        """
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError('expansion index out of range')
+
+        digits = self._digits(index)
+        if self._pruning and self._pruned(digits, 0) is not None:
+            raise IndexError('combination {} is excluded'.format(index))
+
+        return self._build(digits)
+
+    def combination(self, index):
+        """
+        Return combination at given index as dict item => value
+        :param index: integer index
+        :return: dict
+        """
+        if not 0 <= index < self.size:
+            raise IndexError('expansion index out of range')
+
+        return dict(zip(self.keys, self._combination(self._digits(index))))
+
+    def slice(self, start=None, stop=None, step=None):
+        """
+        Yield combinations from given slice (same semantics as slicing range of all indexes)
+        :return: generator
+        """
+        indexes = range(self.size)[start:stop:step]
+
+        if indexes.step == 1:
+            return self._iter_range(indexes.start, indexes.stop)
+
+        digits = (self._digits(index) for index in indexes)
+
+        return (self._build(d) for d in digits if not self._pruning or self._pruned(d, 0) is None)
+
+    def shard(self, index, of):
+        """
+        Yield only combinations from given shard. All combinations are split to `of` contiguous shards of (almost) the
+        same size, so workers can expand just their own part.
+        :param index: index of shard (0 <= index < of)
+        :param of: count of shards
+        :return: generator
+        """
+        if not 0 <= index < of:
+            raise ValueError('shard index must be in range 0-{}'.format(of - 1))
+
+        return self._iter_range(index * self.size // of, (index + 1) * self.size // of)
+
+    def map(self, func=None, executor=None, workers=None, ordered=True, chunksize=64, max_pending=None):
+        """
+        Expand combinations and call func for every expanded item in pool of workers. Both expanding and func run
+        in workers, work is submitted in chunks of combinations and only limited count of chunks is pending at the
+        same time, so memory stays flat.
+        If executor is not given, ProcessPoolExecutor with given count of workers is created (and shut down at the
+        end). For process pools expansion and func must be picklable, they are sent to every worker only once (given
+        ProcessPoolExecutor workers cache them, chunk that hits worker without them is submitted again with them).
+        :param func: callback called for every expanded item, if not given expanded items are returned
+        :param executor: concurrent.futures executor
+        :param workers: count of workers (if executor is not given)
+        :param ordered: yield results in order of combinations, otherwise as they are completed
+        :param chunksize: count of combinations in one chunk
+        :param max_pending: maximum count of pending chunks (defaults to twice the count of workers)
+        :return: generator of results
+        """
+        from concurrent import futures
+
+        owned = executor is None
+        resubmit = None
+        if owned:
+            executor = futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                   initargs=(self, func))
+            submit = functools.partial(executor.submit, _run_chunk)
+        elif isinstance(executor, futures.ProcessPoolExecutor):
+            # expansion is pickled once, chunks carry only token
+            token = uuid.uuid4().hex
+            submit = functools.partial(executor.submit, _run_chunk, token=token)
+            resubmit = functools.partial(submit, payload=pickle.dumps((self, func), pickle.HIGHEST_PROTOCOL))
+        else:
+            submit = functools.partial(executor.submit, _run_chunk, expansion=self, func=func)
+
+        if max_pending is None:
+            max_pending = 2 * (workers or getattr(executor, '_max_workers', None) or 4)
+
+        chunks = iter(range(0, self.size, chunksize))
+        pending = collections.deque()
+        # future => (start, stop) of chunk (to submit it again to worker without expansion)
+        ranges = {}
+
+        try:
+            while True:
+                for start in chunks:
+                    stop = min(start + chunksize, self.size)
+                    future = submit(start, stop)
+                    ranges[future] = start, stop
+                    pending.append(future)
+                    if len(pending) >= max_pending:
+                        break
+
+                if not pending:
+                    break
+
+                if resubmit is not None:
+                    # chunks that hit worker without expansion are submitted again (with it) right away
+                    for position, future in enumerate(pending):
+                        if future.done() and future.exception() is None and future.result() is None:
+                            bounds = ranges.pop(future)
+                            retry = resubmit(*bounds)
+                            ranges[retry] = bounds
+                            pending[position] = retry
+
+                if ordered:
+                    if not pending[0].done():
+                        futures.wait([future for future in pending if not future.done()],
+                                     return_when=futures.FIRST_COMPLETED)
+                        continue
+                    if pending[0].exception() is None and pending[0].result() is None:
+                        continue
+                    done = [pending.popleft()]
+                else:
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    done = [future for future in done if future.exception() is not None or
+                            future.result() is not None]
+                    for future in done:
+                        pending.remove(future)
+
+                for future in done:
+                    del ranges[future]
+                    for result in future.result():
+                        yield result
+        finally:
+            for future in pending:
+                future.cancel()
+            if owned:
+                executor.shutdown(wait=True)
+
+    def _digits(self, index):
+        """
+        Decode index to digits (index of value for every key). Last key is the least significant one.
+        :param index: integer index
+        :return: list of digits
+        """
+        digits = [0] * len(self._radix)
+        for i in range(len(self._radix) - 1, -1, -1):
+            index, digits[i] = divmod(index, self._radix[i])
+        return digits
+
+    def _combination(self, digits):
+        """
+        Return tuple of values for given digits
+        :param digits: list of digits
+        :return:
+        """
+        return tuple(values[digit] for values, digit in zip(self.values, digits))
+
+    def _iter_range(self, start, stop):
+        """
+        Yield combinations in range start-stop (excluded combinations are skipped).
+        :param start: first index
+        :param stop: last index (not included)
+        :return: generator
+        """
+        for digits in self._iter_digits(start, stop):
+            yield self._build(digits)
+
+    def _iter_digits(self, start, stop):
+        """
+        Yield digits of combinations in range start-stop. Only start index is decoded, following combinations are
+        computed by incrementing digits. If partial combination is excluded, all combinations starting with it are
+        skipped at once. Yielded list is changed in place by next iteration.
+        :param start: first index
+        :param stop: last index (not included)
+        :return: generator
+        """
+        if start >= stop:
+            return
+
+        radix = self._radix
+        strides = self._strides
+        count = len(radix)
+        digits = self._digits(start)
+
+        # first depth that has to be checked (lower ones didn't change)
+        check = 0
+
+        while start < stop:
+            depth = self._pruned(digits, check) if self._pruning else None
+
+            if depth is None:
+                yield digits
+                depth = count - 1
+                start += 1
+            else:
+                start += strides[depth] - start % strides[depth]
+
+            # increment digit at depth (and carry), all following digits start from zero
+            for i in range(depth + 1, count):
+                digits[i] = 0
+
+            i = depth
+            while i >= 0:
+                digits[i] += 1
+                if digits[i] < radix[i]:
+                    break
+                digits[i] = 0
+                i -= 1
+
+            check = max(i, 0)
+
+    def _pruned(self, digits, check):
+        """
+        Return the lowest depth where partial combination is excluded (None if it's not excluded)
+        :param digits: list of digits
+        :param check: depth to start with
+        :return:
+        """
+        values = self.values
+
+        for depth in range(check, len(digits)):
+            for rule in self._rules[depth]:
+                if all(values[i][digits[i]] == value for i, value in rule):
+                    return depth
+
+            if self.predicate is not None:
+                partial = dict((self.keys[i], values[i][digits[i]]) for i in range(depth + 1))
+                if not self.predicate(partial):
+                    return depth
+
+        return None
+
+    def _build(self, digits):
+        """
+        Build expanded data for given digits
+        :param digits: list of digits
+        :return: data, Context or view
+        """
+        combination = self._combination(digits)
+
+        if self.view:
+            return self._shape.view(self.context.data, combination)
+
+        if self.as_context:
+            # context owns only copied nodes, shared ones are copied when they are changed through it
+            owned = {}
+            context = self.context._new(self._shape.build(self.context.data, combination, owned))
+            context._owned = owned
+            return context
+
+        return self._shape.build(self.context.data, combination)
@@ -0,0 +1,293 @@
+"""
+Layered
+
+Layered context resolves items through list of contexts (layers), first layer that has the item wins (same as
+collections.ChainMap). Layers are not merged nor copied, so creating layered context (e.g. defaults + environment +
+per request overrides) costs nothing.
+
+Shadowing: dicts (and lists) present in more layers are merged, value that is not container hides everything that
+lower layers have under its item (e.g. 'db': 'sqlite' in upper layer hides 'db.host' of lower layer). Same rule is
+used by item access, keys, data and dumps.
+"""
+from __future__ import print_function
+
+import json
+
+from .context import Context, _containers, _json_default, _sequences, default_encoder
+
+
+class LayeredContext(object):
+    """
+    LayeredContext
+
+    Items are resolved top-down (first layer first), writes go to the first layer.
+    If cache is True, layer that resolved the item is cached for every item, cache is invalidated whenever any layer
+    changes (changes made directly in data are not detected).
+    """
+
+    def __init__(self, *layers, **kwargs):
+        """
+        :param layers: contexts or dicts (dicts are used as they are, see Context.from_data)
+        :param cache: whether to cache resolution of items
+        """
+        self.cache = kwargs.pop('cache', False)
+        assert not kwargs, 'unknown arguments: {}'.format(', '.join(kwargs))
+
+        self.layers = [layer if isinstance(layer, Context) else Context.from_data(layer) for layer in layers]
+        if not self.layers:
+            self.layers.append(Context())
+
+        # parts => index of layer (None if not found)
+        self._resolved = {}
+        self._versions = None
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, ', '.join(repr(layer) for layer in self.layers))
+
+    def new_child(self, layer=None):
+        """
+        Return new layered context with given layer on top of layers of this one
+        :param layer: context or dict (new context is used if not given)
+        :return: LayeredContext
+        """
+        return LayeredContext(Context() if layer is None else layer, *self.layers, cache=self.cache)
+
+    @property
+    def parents(self):
+        """
+        Return layered context of all layers except the first one
+        :return: LayeredContext
+        """
+        return LayeredContext(*self.layers[1:], cache=self.cache)
+
+    def _resolve(self, parsed):
+        """
+        Return (index of layer, value) of all layers that contribute to given item (empty list if no layer has it).
+        Layers are walked part by part, at every prefix the first layer that has it decides: if its value is not
+        container, it shadows values of all lower layers, otherwise only lower layers with container of same kind
+        (dict or list) take part in next step.
+        :param parsed: tuple of parts
+        :return: list of (index, value) tuples
+        """
+        if self.cache:
+            versions = tuple(layer._version for layer in self.layers)
+            if versions != self._versions:
+                self._resolved = {}
+                self._versions = versions
+
+            try:
+                indexes = self._resolved[parsed]
+            except KeyError:
+                pass
+            else:
+                return [(index, self.layers[index]._get_parts(parsed)) for index in indexes]
+
+        found = [(index, None) for index in range(len(self.layers))]
+
+        for depth in range(1, len(parsed) + 1):
+            prefix, active, found = parsed[:depth], found, []
+
+            for index, _ in active:
+                try:
+                    value = self.layers[index]._get_parts(prefix)
+                except KeyError:
+                    continue
+
+                if not found:
+                    kind = _kind(value)
+                    found.append((index, value))
+                    if kind is None:
+                        break
+                elif _kind(value) is kind:
+                    found.append((index, value))
+
+            if not found:
+                break
+
+        if self.cache:
+            self._resolved[parsed] = [index for index, _ in found]
+
+        return found
+
+    def __getitem__(self, item):
+        """
+        Return item, containers that are present in more layers are merged (new dict/list is built)
+        :param item: dotted item
+        :return:
+        """
+        found = self._resolve(Context._parse_path(item))
+        if not found:
+            raise KeyError(item)
+        if len(found) == 1:
+            return found[0][1]
+        return _merge([value for _, value in found])
+
+    def __setitem__(self, item, value):
+        self.layers[0][item] = value
+
+    def __delitem__(self, item):
+        """
+        Delete item from the first layer (KeyError is raised if it's not there)
+        :param item:
+        :return:
+        """
+        del self.layers[0][item]
+
+    def __contains__(self, item):
+        return bool(self._resolve(Context._parse_path(item)))
+
+    def get(self, item, default=None):
+        """
+        If not found set default value (to the first layer) and return it
+        :param item: dotted syntax item
+        :param default: default value
+        :return:
+        """
+        try:
+            return self[item]
+        except KeyError:
+            self[item] = default
+
+        return default
+
+    def pop(self, item, default=None):
+        """
+        Pops item from the first layer
+        :param item:
+        :param default:
+        :return:
+        """
+        return self.layers[0].pop(item, default)
+
+    def keys(self, item=None, strip=False):
+        """
+        Return all keys of merged data in sorted order
+        :param item: item to start with
+        :param strip: if item is given whether to strip item from keys
+        :return:
+        """
+        return [key for key, _ in self.iteritems(item=item, strip=strip)]
+
+    def iteritems(self, item=None, strip=False):
+        """
+        Return key/value items (tuple) of merged data in sorted order, only subtree of item is merged
+        :return:
+        """
+        current = self._subtree(item)
+
+        if item is None:
+            prefix = ''
+        else:
+            prefix = '' if strip else '{}.'.format(item)
+            if not isinstance(current, _containers):
+                return iter([('' if strip else item, current)])
+
+        return _walker._walk(current, prefix, sort=True, resolve=False)
+
+    def items(self, item=None, strip=False):
+        return list(self.iteritems(item=item, strip=strip))
+
+    def to_flat(self, item=None):
+        """
+        Return flat dict dotted item => value of resolved leaves
+        :param item: item to start with
+        :return: dict
+        """
+        return dict(self.iteritems(item=item))
+
+    @property
+    def data(self):
+        """
+        Return data of all layers merged together (built on every call, containers are new, leaves are shared)
+        :return: dict
+        """
+        return _merge([layer.data for layer in self.layers])
+
+    def dumps(self, item=None, **kwargs):
+        """
+        Dumps returns json string of merged data for given item
+        :param item: item name such as 'result.0.user'
+        :param kwargs: additional kwargs passed to json.dumps
+        :return: json string
+        """
+        try:
+            target = self._subtree(item or None)
+        except KeyError:
+            target = None
+
+        if kwargs:
+            kwargs.setdefault('default', _json_default)
+            return json.dumps(target, **kwargs)
+
+        return default_encoder(target)
+
+    def _subtree(self, item):
+        """
+        Return merged value of item (merged data if item is not given), only layers that contribute to item are merged
+        :param item: dotted item
+        :return:
+        """
+        if item is None:
+            return self.data
+
+        found = self._resolve(Context._parse_path(item))
+        if not found:
+            raise KeyError(item)
+
+        return _merge_child([value for _, value in found])
+
+
+# used to walk merged values (has no memo, merged values are already resolved)
+_walker = Context()
+
+
+def _kind(value):
+    """
+    Return kind of container (dict or list) or None if value is not container
+    :param value:
+    :return:
+    """
+    if isinstance(value, dict):
+        return dict
+    if isinstance(value, _sequences + (tuple,)):
+        return list
+    return None
+
+
+def _merge(values):
+    """
+    Merge containers of same kind (first one wins), values in them are resolved by same rules as items are.
+    :param values: list of dicts or list of lists (top layer first)
+    :return: new dict or list
+    """
+    if _kind(values[0]) is dict:
+        result = {}
+        for value in values:
+            for key in value:
+                if key not in result:
+                    result[key] = _merge_child([other[key] for other in values if key in other])
+        return result
+
+    return [
+        _merge_child([other[index] for other in values if index < len(other)])
+        for index in range(max(len(value) for value in values))
+    ]
+
+
+def _merge_child(values):
+    """
+    Return merged value of child of containers
+    :param values: list of values (top layer first)
+    :return:
+    """
+    resolved = []
+    for value in values:
+        while callable(value):
+            value = value()
+        resolved.append(value)
+
+    kind = _kind(resolved[0])
+    if kind is None:
+        return resolved[0]
+
+    return _merge([value for value in resolved if _kind(value) is kind])
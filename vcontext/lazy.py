@@ -0,0 +1,395 @@
+"""
+Lazy
+
+Lazy loading of large json documents. Objects are only indexed (keys and positions of their values are found),
+values are parsed when they are accessed for the first time and then they are cached.
+"""
+from __future__ import print_function
+
+import json
+import mmap
+import re
+
+import six
+
+# json values smaller than this (in bytes) are parsed at once instead of being indexed
+EAGER_SIZE = 4096
+
+_whitespace = re.compile(br'[ \t\n\r]*')
+_string = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_structure = re.compile(br'["\[\]{}]')
+_scalar = re.compile(br'[^,\]}\s]+')
+
+
+class Deferred(object):
+    """
+    Value that is loaded when it's accessed for the first time.
+    """
+
+    __slots__ = ()
+
+    def load(self):
+        """
+        Load and return value
+        :return:
+        """
+        raise NotImplementedError
+
+
+class LazyDict(dict):
+    """
+    LazyDict
+
+    dict where values can be Deferred. Deferred value is loaded when it's accessed and replaced by loaded value.
+    """
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, Deferred):
+            value = value.load()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __iter__(self):
+        # overridden (same as keys), so C level merges (dict(lazy), {**lazy}, update) use keys and __getitem__
+        # instead of copying raw storage with Deferred values
+        return dict.__iter__(self)
+
+    def keys(self):
+        return dict.keys(self)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def pop(self, key, *args):
+        value = dict.pop(self, key, *args)
+        if isinstance(value, Deferred):
+            value = value.load()
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        if isinstance(value, Deferred):
+            value = value.load()
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def copy(self):
+        return self.__copy__()
+
+    def __copy__(self):
+        # Deferred values are shared, they are not loaded
+        new = LazyDict()
+        for key in self:
+            dict.__setitem__(new, key, dict.__getitem__(self, key))
+        return new
+
+    def deferred(self):
+        """
+        Return list of keys, values of which were not loaded yet
+        :return: list
+        """
+        return [key for key in self if isinstance(dict.__getitem__(self, key), Deferred)]
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.items()) == (dict(other.items()) if isinstance(other, LazyDict) else other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class LazyList(list):
+    """
+    LazyList
+
+    list where items can be Deferred. Deferred item is loaded when it's accessed and replaced by loaded value.
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        value = list.__getitem__(self, index)
+        if isinstance(value, Deferred):
+            value = value.load()
+            list.__setitem__(self, index, value)
+        return value
+
+    def __iter__(self):
+        # overridden, so C level copies (list(lazy), extend) use __getitem__ instead of raw storage
+        for index in range(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def __contains__(self, value):
+        return any(item is value or item == value for item in self)
+
+    def index(self, value, *args):
+        return list(self).index(value, *args)
+
+    def count(self, value):
+        return list(self).count(value)
+
+    def pop(self, *args):
+        value = list.pop(self, *args)
+        if isinstance(value, Deferred):
+            value = value.load()
+        return value
+
+    def copy(self):
+        return self.__copy__()
+
+    def __copy__(self):
+        # Deferred items are shared, they are not loaded
+        return LazyList(list.__iter__(self))
+
+    def deferred(self):
+        """
+        Return list of indexes, items of which were not loaded yet
+        :return: list
+        """
+        return [index for index, value in enumerate(list.__iter__(self)) if isinstance(value, Deferred)]
+
+    def __eq__(self, other):
+        if not isinstance(other, list):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class LazyTuple(tuple):
+    """
+    LazyTuple
+
+    tuple where items can be Deferred. Tuple can't be changed, so loaded items are kept aside (if cache is True).
+    """
+
+    def __new__(cls, items=(), cache=True):
+        result = tuple.__new__(cls, items)
+        result._loaded = {} if cache else None
+        return result
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self[i] for i in range(len(self))[index])
+        value = tuple.__getitem__(self, index)
+        if not isinstance(value, Deferred):
+            return value
+        if self._loaded is None:
+            return value.load()
+
+        index = index + len(self) if index < 0 else index
+        try:
+            return self._loaded[index]
+        except KeyError:
+            value = self._loaded[index] = value.load()
+            return value
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def __contains__(self, value):
+        return any(item is value or item == value for item in self)
+
+    def index(self, value, *args):
+        return tuple(self).index(value, *args)
+
+    def count(self, value):
+        return tuple(self).count(value)
+
+    def __getnewargs__(self):
+        # copy and pickle make tuple of loaded items
+        return tuple(self),
+
+    def deferred(self):
+        """
+        Return list of indexes, items of which were not loaded yet
+        :return: list
+        """
+        loaded = self._loaded or {}
+        return [
+            index for index, value in enumerate(tuple.__iter__(self))
+            if isinstance(value, Deferred) and index not in loaded
+        ]
+
+    def __eq__(self, other):
+        if not isinstance(other, tuple):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
+class _JSONValue(Deferred):
+    """
+    Json value in buffer (not parsed yet)
+    """
+
+    __slots__ = ('buf', 'start', 'end')
+
+    def __init__(self, buf, start, end):
+        self.buf = buf
+        self.start = start
+        self.end = end
+
+    def load(self):
+        return _parse(self.buf, self.start, self.end)
+
+
+def _skip_whitespace(buf, pos):
+    return _whitespace.match(buf, pos).end()
+
+
+def _skip_value(buf, pos):
+    """
+    Return end position of json value that starts at pos (value is not parsed)
+    :param buf: buffer
+    :param pos: start position
+    :return: end position
+    """
+    char = buf[pos:pos + 1]
+
+    if char == b'"':
+        return _string.match(buf, pos).end()
+
+    if char not in (b'{', b'['):
+        match = _scalar.match(buf, pos)
+        if match is None:
+            raise ValueError('Invalid json at position {}'.format(pos))
+        return match.end()
+
+    depth = 0
+    while True:
+        match = _structure.search(buf, pos)
+        if match is None:
+            raise ValueError('Invalid json at position {}'.format(pos))
+
+        char = match.group()
+        if char == b'"':
+            pos = _string.match(buf, match.start()).end()
+            continue
+
+        depth += 1 if char in (b'{', b'[') else -1
+        pos = match.end()
+        if depth == 0:
+            return pos
+
+
+def _parse(buf, start, end):
+    """
+    Parse json value, large objects are only indexed.
+    :param buf: buffer
+    :param start: start position
+    :param end: end position
+    :return: value
+    """
+    if buf[start:start + 1] == b'{' and end - start >= EAGER_SIZE:
+        return _index_object(buf, start)
+
+    return json.loads(buf[start:end].decode('utf-8'))
+
+
+def _index_object(buf, pos):
+    """
+    Index json object that starts at pos
+    :param buf: buffer
+    :param pos: start position
+    :return: LazyDict
+    """
+    result = LazyDict()
+
+    pos = _skip_whitespace(buf, pos + 1)
+    if buf[pos:pos + 1] == b'}':
+        return result
+
+    while True:
+        match = _string.match(buf, pos)
+        if match is None:
+            raise ValueError('Invalid json at position {}'.format(pos))
+        key = json.loads(match.group().decode('utf-8'))
+
+        pos = _skip_whitespace(buf, match.end())
+        if buf[pos:pos + 1] != b':':
+            raise ValueError('Invalid json at position {}'.format(pos))
+
+        start = _skip_whitespace(buf, pos + 1)
+        end = _skip_value(buf, start)
+        dict.__setitem__(result, key, _JSONValue(buf, start, end))
+
+        pos = _skip_whitespace(buf, end)
+        char = buf[pos:pos + 1]
+        if char == b'}':
+            return result
+        if char != b',':
+            raise ValueError('Invalid json at position {}'.format(pos))
+
+        pos = _skip_whitespace(buf, pos + 1)
+
+
+def load(source, use_mmap=False):
+    """
+    Load json object lazily
+    :param source: path or file like object
+    :param use_mmap: whether to map file to memory instead of reading it
+    :return: LazyDict
+    """
+    if isinstance(source, six.string_types):
+        with open(source, 'rb') as fp:
+            return load(fp, use_mmap=use_mmap)
+
+    if use_mmap:
+        buf = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        buf = source.read()
+        if isinstance(buf, six.text_type):
+            buf = buf.encode('utf-8')
+
+    pos = _skip_whitespace(buf, 0)
+    if buf[pos:pos + 1] != b'{':
+        raise ValueError('Context data must be json object')
+
+    return _index_object(buf, pos)
@@ -0,0 +1,163 @@
+"""
+Shared
+
+read-only context stored in shared memory (multiprocessing.shared_memory, python 3.8+). Data are frozen to binary
+snapshot (see snapshot module) that is stored in shared memory block once per host, every process attaches to it
+and decodes only parts of data it accesses. Decoded parts of large dicts are not kept by process (they are decoded
+again on every access, also by keys/walk/dumps), so memory of workers does not grow towards full copy of data,
+price is CPU time spent decoding accessed nodes repeatedly (copy hot parts to ordinary context if needed).
+"""
+from __future__ import print_function
+
+from . import snapshot as _snapshot
+from .context import Context
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # pragma: no cover
+    resource_tracker = shared_memory = None
+
+# names of shared memory blocks created by this process (inherited by forked processes)
+_created = set()
+
+
+class SharedContext(Context):
+    """
+    SharedContext
+
+    read-only context backed by shared memory block. Use SharedContext.create in parent process and
+    SharedContext.attach(name) in other processes (forked processes can use inherited context directly, pickled
+    context is attached by name). Every change raises TypeError, copy returns ordinary (writable) Context.
+    """
+
+    def __init__(self, shm, owner=False, **kwargs):
+        """
+        Use create or attach instead
+        :param shm: SharedMemory with snapshot
+        :param owner: whether this context created shared memory block
+        :param kwargs: passed to Context.new (e.g. dict_)
+        """
+        super(SharedContext, self).__init__(dict_=kwargs.pop('dict_', self.dict_))
+        self.shm = shm
+        self.owner = owner
+        self._data = _snapshot.loads(shm.buf, lazy=True, cache=False)
+        self._configure(**kwargs)
+
+    @classmethod
+    def create(cls, data, name=None, **kwargs):
+        """
+        Freeze data to new shared memory block
+        :param data: Context or dict
+        :param name: name of shared memory block (random name if not given)
+        :param kwargs: passed to Context.new (e.g. dict_)
+        :return: SharedContext
+        """
+        _check()
+
+        encoded = _snapshot._encode(data.data if isinstance(data, Context) else data)
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=len(encoded))
+        shm.buf[:len(encoded)] = encoded
+        _created.add(shm.name)
+
+        return cls(shm, owner=True, **kwargs)
+
+    @classmethod
+    def attach(cls, name, untrack=True, **kwargs):
+        """
+        Attach to existing shared memory block
+        :param name: name of shared memory block
+        :param untrack: whether to remove block from resource tracker of this process (before python 3.13 attached
+                        block is registered to resource tracker that would unlink it when process exits). It must be
+                        False when resource tracker is shared with creator (processes started by multiprocessing).
+        :param kwargs: passed to Context.new (e.g. dict_)
+        :return: SharedContext
+        """
+        _check()
+
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            if untrack and shm.name not in _created:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+
+        return cls(shm, **kwargs)
+
+    @property
+    def name(self):
+        """
+        Name of shared memory block (to be passed to attach)
+        :return: str
+        """
+        return self.shm.name
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.name)
+
+    def __reduce__(self):
+        # only name is pickled, other process (started by multiprocessing) attaches to same block
+        return _attach, (self.__class__, self.name)
+
+    def close(self):
+        """
+        Close access to shared memory block in this process (data that were not decoded yet can't be accessed then)
+        :return:
+        """
+        self._data = self.dict_()
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Remove shared memory block (should be called once by creator when no process needs it anymore)
+        :return:
+        """
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('{} is read-only'.format(self.__class__.__name__))
+
+    _set_parts = _del_parts = _set_many = _delete_many = _set_column = _read_only
+
+    def get(self, item, default=None):
+        """
+        Return item or default if not found (default is not set since context is read-only)
+        :param item: dotted syntax item
+        :param default: default value
+        :return:
+        """
+        try:
+            return self[item]
+        except KeyError:
+            return default
+
+    def copy(self, cow=False):
+        """
+        Copy data to new ordinary (writable) context
+        :param cow: copy on write - data is not copied, decoded nodes are shared
+        :return: Context
+        """
+        if cow:
+            new = Context.new(**self._settings())
+            new._data = self._data.copy()
+            new._owned = {id(new._data): new._data}
+            return new
+
+        return Context.from_data(self.copy_value(), expand_dots=False, **self._settings())
+
+
+def _attach(cls, name):
+    return cls.attach(name, untrack=False)
+
+
+def _check():
+    if shared_memory is None:
+        raise RuntimeError('shared memory is not supported (python 3.8+ is required)')
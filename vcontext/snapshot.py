@@ -0,0 +1,452 @@
+"""
+Snapshot
+
+binary snapshot of context data. Every value is tagged and containers are length prefixed, so they can be skipped
+without decoding. Dict keys are interned in key table (every distinct key is stored only once). Snapshot can be
+compressed (zlib), uncompressed snapshot can be mapped to memory, so large dicts and lists are decoded only when
+they are accessed (LazyDict, LazyList, LazyTuple).
+
+Layout:
+    header - magic, version, flags, offset of key table in payload
+    payload - encoded root dict followed by key table (whole payload is compressed in compressed mode)
+"""
+from __future__ import print_function
+
+import mmap
+import struct
+import zlib
+
+import six
+
+from .lazy import EAGER_SIZE, Deferred, LazyDict, LazyList, LazyTuple
+
+MAGIC = b'VCSN'
+VERSION = 1
+
+# flags
+COMPRESSED = 1
+
+_header = struct.Struct('<4sBBQ')
+_size = struct.Struct('<Q')
+_count = struct.Struct('<I')
+_int = struct.Struct('<q')
+_float = struct.Struct('<d')
+_tagged_int = struct.Struct('<cq')
+_tagged_float = struct.Struct('<cd')
+_tagged_count = struct.Struct('<cI')
+_tagged_container = struct.Struct('<cQI')
+_key_value = struct.Struct('<Ic')
+_container_body = struct.Struct('<QI')
+
+# size of container header (tag, size of body, count)
+_container = _tagged_container.size
+
+# tags
+NONE, TRUE, FALSE = b'N', b'T', b'F'
+INT, BIGINT, FLOAT = b'i', b'I', b'f'
+TEXT, BYTES = b's', b'b'
+DICT, LIST, TUPLE, SPARSE = b'd', b'l', b't', b'p'
+_containers = (DICT, LIST, TUPLE, SPARSE)
+
+_min_int, _max_int = -(1 << 63), (1 << 63) - 1
+
+
+class _Writer(object):
+    """
+    Encoder of data to bytearray
+    """
+
+    def __init__(self):
+        self.out = bytearray()
+        # key => index in key table
+        self.keys = {}
+
+    def key(self, key):
+        """
+        Return index of key in key table
+        :param key: string or integer key
+        :return: index
+        """
+        try:
+            return self.keys[key]
+        except KeyError:
+            if not isinstance(key, six.string_types + six.integer_types) or isinstance(key, bool):
+                raise TypeError('snapshot supports only string and integer keys: {!r}'.format(key))
+            index = self.keys[key] = len(self.keys)
+            return index
+
+    def value(self, value):
+        """
+        Encode value (hot path, common types are checked first)
+        :param value: value
+        :return:
+        """
+        out = self.out
+        cls = value.__class__
+
+        if cls is six.text_type:
+            encoded = value.encode('utf-8')
+            out += _tagged_count.pack(TEXT, len(encoded))
+            out += encoded
+        elif cls is int and _min_int <= value <= _max_int:
+            out += _tagged_int.pack(INT, value)
+        elif value is None:
+            out += NONE
+        elif cls is bool:
+            out += TRUE if value else FALSE
+        elif cls is float:
+            out += _tagged_float.pack(FLOAT, value)
+        elif isinstance(value, dict):
+            start = self.container(DICT, len(value))
+            keys, key, encode = self.keys, self.key, self.value
+            for name, item in value.items():
+                try:
+                    out += _count.pack(keys[name])
+                except KeyError:
+                    out += _count.pack(key(name))
+                encode(item)
+            self.close(start)
+        elif isinstance(value, (list, tuple)):
+            start = self.container(TUPLE if isinstance(value, tuple) else LIST, len(value))
+            encode = self.value
+            for item in value:
+                encode(item)
+            self.close(start)
+        elif isinstance(value, _sparse()):
+            items = value.items()
+            start = self.container(SPARSE, len(value))
+            out += _count.pack(len(items))
+            for index, item in items:
+                out += _count.pack(index)
+                self.value(item)
+            self.close(start)
+        else:
+            self.scalar(value)
+
+    def scalar(self, value):
+        """
+        Encode scalar value (types not handled by value method)
+        :param value: value
+        :return:
+        """
+        out = self.out
+
+        if isinstance(value, bool):
+            out += TRUE if value else FALSE
+        elif isinstance(value, six.integer_types):
+            if _min_int <= value <= _max_int:
+                out += _tagged_int.pack(INT, value)
+            else:
+                encoded = str(value).encode('ascii')
+                out += _tagged_count.pack(BIGINT, len(encoded))
+                out += encoded
+        elif isinstance(value, float):
+            out += _tagged_float.pack(FLOAT, value)
+        elif isinstance(value, six.text_type):
+            encoded = value.encode('utf-8')
+            out += _tagged_count.pack(TEXT, len(encoded))
+            out += encoded
+        elif isinstance(value, six.binary_type):
+            out += _tagged_count.pack(BYTES, len(value))
+            out += value
+        else:
+            raise TypeError('value is not supported by snapshot: {!r}'.format(value))
+
+    def container(self, tag, count):
+        """
+        Write header of container (size of body is written by close)
+        :return: start position of container
+        """
+        start = len(self.out)
+        self.out += _tagged_container.pack(tag, 0, count)
+        return start
+
+    def close(self, start):
+        _size.pack_into(self.out, start + 1, len(self.out) - start - _container)
+
+    def key_table(self):
+        self.out += _count.pack(len(self.keys))
+        for key, _ in sorted(six.iteritems(self.keys), key=lambda item: item[1]):
+            self.scalar(key)
+
+
+def _sparse():
+    # imported here to avoid circular import
+    from .context import SparseList
+    return SparseList
+
+
+def _encode(data, compress=False, level=6):
+    """
+    Return snapshot of data. Header is reserved at the start of buffer and filled in when payload is written, so
+    uncompressed snapshot is never copied.
+    :param data: dict
+    :param compress: whether to compress snapshot
+    :param level: compression level
+    :return: bytearray (bytes if compressed)
+    """
+    assert isinstance(data, dict), 'Snapshot data must be dictionary'
+
+    writer = _Writer()
+    writer.out += b'\0' * _header.size
+    writer.value(data)
+    keys_offset = len(writer.out) - _header.size
+    writer.key_table()
+
+    out = writer.out
+    if compress:
+        payload = zlib.compress(bytes(out[_header.size:]), level)
+        return _header.pack(MAGIC, VERSION, COMPRESSED, keys_offset) + payload
+
+    _header.pack_into(out, 0, MAGIC, VERSION, 0, keys_offset)
+    return out
+
+
+def dumps(data, compress=False, level=6):
+    """
+    Return snapshot of data
+    :param data: dict
+    :param compress: whether to compress snapshot (compressed snapshot can't be loaded lazily from mmap)
+    :param level: compression level
+    :return: bytes
+    """
+    return bytes(_encode(data, compress=compress, level=level))
+
+
+def dump(data, fp, compress=False, level=6):
+    """
+    Write snapshot of data to file
+    :param data: dict
+    :param fp: path or file like object (binary)
+    :param compress: whether to compress snapshot (compressed snapshot can't be loaded lazily from mmap)
+    :param level: compression level
+    :return:
+    """
+    if isinstance(fp, six.string_types):
+        with open(fp, 'wb') as f:
+            return dump(data, f, compress=compress, level=level)
+
+    fp.write(_encode(data, compress=compress, level=level))
+
+
+class _SnapshotValue(Deferred):
+    """
+    Container in snapshot (not decoded yet)
+    """
+
+    __slots__ = ('reader', 'pos')
+
+    def __init__(self, reader, pos):
+        self.reader = reader
+        self.pos = pos
+
+    def load(self):
+        return self.reader.value(self.pos)[0]
+
+
+class _UncachedDict(LazyDict):
+    """
+    LazyDict that decodes deferred value on every access, decoded values are not kept (memory of process does not
+    grow with accessed data, buffer is the only copy)
+    """
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, Deferred):
+            value = value.load()
+        return value
+
+
+class _UncachedList(LazyList):
+    """
+    LazyList that decodes deferred item on every access (see _UncachedDict)
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        value = list.__getitem__(self, index)
+        if isinstance(value, Deferred):
+            value = value.load()
+        return value
+
+
+class _Reader(object):
+    """
+    Decoder of snapshot buffer
+    """
+
+    def __init__(self, buf, lazy, cache=True):
+        """
+        :param buf: buffer (bytes or mmap)
+        :param lazy: whether large dicts are decoded lazily
+        :param cache: whether lazily decoded values are kept
+        """
+        self.buf = buf
+        self.lazy = lazy
+        self.cache = cache
+        self.keys = None
+
+    def read_keys(self, pos):
+        count = _count.unpack_from(self.buf, pos)[0]
+        pos += _count.size
+        keys = []
+        for _ in range(count):
+            key, pos = self.value(pos)
+            keys.append(key)
+        self.keys = keys
+
+    def value(self, pos):
+        """
+        Decode value at position (hot path, common types are checked first)
+        :param pos: position in buffer
+        :return: (value, end position)
+        """
+        buf = self.buf
+        tag = buf[pos:pos + 1]
+
+        if tag == TEXT:
+            length = _count.unpack_from(buf, pos + 1)[0]
+            pos += _tagged_count.size
+            return six.text_type(buf[pos:pos + length], 'utf-8'), pos + length
+        if tag == INT:
+            return _int.unpack_from(buf, pos + 1)[0], pos + _tagged_int.size
+        if tag == DICT:
+            size, count = _container_body.unpack_from(buf, pos + 1)
+            return self.dict(pos + _container, count, size), pos + _container + size
+        if tag == NONE:
+            return None, pos + 1
+        if tag == TRUE:
+            return True, pos + 1
+        if tag == FALSE:
+            return False, pos + 1
+        if tag == FLOAT:
+            return _float.unpack_from(buf, pos + 1)[0], pos + _tagged_float.size
+        if tag == LIST or tag == TUPLE:
+            size, count = _container_body.unpack_from(buf, pos + 1)
+            return self.sequence(pos + _container, count, size, tag), pos + _container + size
+        if tag == SPARSE:
+            size, count = _container_body.unpack_from(buf, pos + 1)
+            end = pos + _container + size
+            pos += _container
+            result = _sparse()()
+            result.resize(count)
+            items = _count.unpack_from(buf, pos)[0]
+            pos += _count.size
+            for _ in range(items):
+                index = _count.unpack_from(buf, pos)[0]
+                result[index], pos = self.value(pos + _count.size)
+            return result, end
+        if tag == BYTES or tag == BIGINT:
+            length = _count.unpack_from(buf, pos + 1)[0]
+            pos += _tagged_count.size
+            value = buf[pos:pos + length]
+            return (bytes(value) if tag == BYTES else int(bytes(value).decode('ascii'))), pos + length
+
+        raise ValueError('Invalid snapshot tag {!r} at position {}'.format(tag, pos))
+
+    def dict(self, pos, count, size):
+        """
+        Decode dict. If reader is lazy, large dicts are decoded to LazyDict, where container values are Deferred.
+        :param pos: position of first item
+        :param count: number of items
+        :param size: size of dict body
+        :return: dict
+        """
+        buf, keys, value = self.buf, self.keys, self.value
+
+        if not self.lazy or size < EAGER_SIZE:
+            result = {}
+            for _ in range(count):
+                key = keys[_count.unpack_from(buf, pos)[0]]
+                result[key], pos = value(pos + _count.size)
+            return result
+
+        result = LazyDict() if self.cache else _UncachedDict()
+        for _ in range(count):
+            index, tag = _key_value.unpack_from(buf, pos)
+            pos += _count.size
+            if tag in _containers:
+                dict.__setitem__(result, keys[index], _SnapshotValue(self, pos))
+                pos += _container + _size.unpack_from(buf, pos + 1)[0]
+            else:
+                item, pos = value(pos)
+                dict.__setitem__(result, keys[index], item)
+        return result
+
+    def sequence(self, pos, count, size, tag):
+        """
+        Decode list or tuple. If reader is lazy, large ones are decoded to LazyList/LazyTuple, where container items
+        are Deferred (offset of item in buffer).
+        :param pos: position of first item
+        :param count: number of items
+        :param size: size of body
+        :param tag: LIST or TUPLE
+        :return: list or tuple
+        """
+        buf, value = self.buf, self.value
+        result = []
+
+        if not self.lazy or size < EAGER_SIZE:
+            for _ in range(count):
+                item, pos = value(pos)
+                result.append(item)
+            return tuple(result) if tag == TUPLE else result
+
+        for _ in range(count):
+            if buf[pos:pos + 1] in _containers:
+                result.append(_SnapshotValue(self, pos))
+                pos += _container + _size.unpack_from(buf, pos + 1)[0]
+            else:
+                item, pos = value(pos)
+                result.append(item)
+
+        if tag == TUPLE:
+            return LazyTuple(result, cache=self.cache)
+        return LazyList(result) if self.cache else _UncachedList(result)
+
+
+def loads(buf, lazy=True, cache=True):
+    """
+    Load snapshot from buffer
+    :param buf: bytes, mmap or memoryview (buffer must not be changed while data are used)
+    :param lazy: whether large dicts are decoded when they are accessed
+    :param cache: whether lazily decoded values are kept (otherwise they are decoded on every access)
+    :return: dict (LazyDict)
+    """
+    if len(buf) < _header.size:
+        raise ValueError('Invalid snapshot')
+
+    magic, version, flags, keys_offset = _header.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError('Invalid snapshot')
+    if version != VERSION:
+        raise ValueError('Unsupported snapshot version {}'.format(version))
+
+    offset = _header.size
+    if flags & COMPRESSED:
+        buf, offset = zlib.decompress(bytes(buf[offset:])), 0
+
+    reader = _Reader(buf, lazy, cache)
+    reader.read_keys(offset + keys_offset)
+    return reader.value(offset)[0]
+
+
+def load(source, use_mmap=False, lazy=True):
+    """
+    Load snapshot
+    :param source: path or file like object (binary)
+    :param use_mmap: whether to map file to memory instead of reading it (ignored for compressed snapshot)
+    :param lazy: whether large dicts are decoded when they are accessed
+    :return: dict (LazyDict)
+    """
+    if isinstance(source, six.string_types):
+        with open(source, 'rb') as fp:
+            return load(fp, use_mmap=use_mmap, lazy=lazy)
+
+    if use_mmap:
+        buf = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        buf = source.read()
+
+    return loads(buf, lazy=lazy)
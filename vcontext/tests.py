@@ -1,9 +1,24 @@
+import copy
+import json
 import operator
+import os
+import pickle
+import shutil
+import tempfile
+import time
 import unittest
 
-from .context import Context
+from . import benchmarks, shared, snapshot
+from .context import Accessor, Context, SparseList, json_encoder, orjson, orjson_encoder
+from .layered import LayeredContext
+from .lazy import LazyDict, LazyList, LazyTuple
+from .shared import SharedContext
 import six
 
+
+def dump_expanded(data):
+    return Context(data).dumps(sort_keys=True)
+
 class ContextTest(unittest.TestCase):
 
     def test_set(self):
@@ -26,6 +41,59 @@ class ContextTest(unittest.TestCase):
         mi = max(data, key=lambda item: item['index'])
         self.assertEqual(len(context[prefix]), mi['index'] + 1)
 
+    def test_set_large_index(self):
+        context = Context()
+        context['items.3.value'] = 1
+        context['items.1'] = 'one'
+        self.assertEqual(context['items'], [None, 'one', None, {'value': 1}])
+
+        # integer keys in dict are kept
+        context = Context({'a': {'0': 'zero'}})
+        context['a.1'] = 'one'
+        self.assertEqual(context['a'], {0: 'zero', 1: 'one'})
+
+        context = Context({'a': 'string'})
+        context['a.1'] = 'one'
+        self.assertEqual(context['a'], [None, 'one'])
+
+    def test_init_kwargs(self):
+        context = Context(journal='on', encoder='utf8', instrument=1, path_index=True)
+        self.assertEqual(context.data, {'journal': 'on', 'encoder': 'utf8', 'instrument': 1, 'path_index': True})
+        self.assertIsNone(context._journal)
+        self.assertIsNone(context.encoder)
+
+        context = Context.new({'a': 1}, journal=True, path_index=True)
+        self.assertEqual(context.data, {'a': 1})
+        self.assertIsNotNone(context._journal)
+        self.assertIsNotNone(context._index)
+        self.assertRaises(TypeError, Context.new, unknown=1)
+
+    def test_sparse_list(self):
+        context = Context.new(sparse_threshold=1000)
+        context['events.100000.name'] = 'event'
+        context['small.1'] = 'small'
+
+        self.assertIsInstance(context['events'], SparseList)
+        self.assertEqual(context['small'], [None, 'small'])
+        self.assertEqual(len(context['events']), 100001)
+        self.assertEqual(context['events.5'], None)
+        self.assertEqual(context['events.100000.name'], 'event')
+        self.assertRaises(KeyError, operator.getitem, context, 'events.100001')
+
+        context['events.200000'] = 'last'
+        self.assertEqual(context.keys(), ['events.100000.name', 'events.200000', 'small.0', 'small.1'])
+
+        del context['events.0']
+        self.assertEqual(context['events.99999.name'], 'event')
+        self.assertEqual(len(context['events']), 200000)
+
+        self.assertEqual(Context({'a': SparseList([None, 1])}).dumps(indent=None), '{"a": [null, 1]}')
+        self.assertEqual(SparseList([1, None, 2]), [1, None, 2])
+
+        cow = context.copy(cow=True)
+        cow['events.5'] = 'five'
+        self.assertEqual(context['events.5'], None)
+
     def test_delete(self):
         context = Context()
         context['hello.how.are.you.0'] = 'world'
@@ -46,6 +114,646 @@ class ContextTest(unittest.TestCase):
         context['hello.test_call'] = Shout
         self.assertEqual(context['hello.test_call.shout'], "shout")
 
+    def test_from_data(self):
+        nested = {'plain': {'value': 1}, 'list': [{'x': 1}]}
+        data = {'a': nested, 'b.c': {'d.e': 1, '0': 'zero'}, 'f': [{'g.h': 1}]}
+
+        context = Context.from_data(data)
+        self.assertIs(context.data, data)
+        self.assertIs(context['a'], nested)
+        self.assertEqual(data, {
+            'a': {'plain': {'value': 1}, 'list': [{'x': 1}]},
+            'b': {'c': {'d': {'e': 1}, 0: 'zero'}},
+            'f': [{'g': {'h': 1}}],
+        })
+
+        data = {'a.b': 1}
+        self.assertEqual(Context.from_data(data, expand_dots=False).data, {'a.b': 1})
+        self.assertEqual(Context(data).data, {'a': {'b': 1}})
+
+    def test_flat(self):
+        flat = {
+            'a.b.0.c': 1,
+            'a.b.0.d': 2,
+            'a.b.2.c': 3,
+            'a.e': 'e',
+            'f': {'g.h': 4},
+            'i.10': 5,
+            'i.2': 6,
+        }
+        context = Context.from_flat(flat)
+
+        expected = Context()
+        for key, value in flat.items():
+            expected[key] = value
+
+        self.assertEqual(context.data, expected.data)
+        self.assertEqual(context['a.b'], [{'c': 1, 'd': 2}, None, {'c': 3}])
+        self.assertEqual(context['f.g.h'], 4)
+
+        result = context.to_flat()
+        self.assertEqual(result.pop('a.b.1'), None)
+        self.assertEqual([result.pop('i.{}'.format(i)) for i in range(11)], [None] * 2 + [6] + [None] * 7 + [5])
+        self.assertEqual(result, {'a.b.0.c': 1, 'a.b.0.d': 2, 'a.b.2.c': 3, 'a.e': 'e', 'f.g.h': 4})
+        self.assertEqual(Context.from_flat(context.to_flat()).data, context.data)
+        self.assertEqual(context.to_flat('a.b.0'), {'a.b.0.c': 1, 'a.b.0.d': 2})
+
+    def test_dumps(self):
+        data = {'result': [{'user': {'username': 'phonkee', 'id': 1}}], 'big': 2 ** 70, 0: SparseList([1])}
+        context = Context(data)
+        expected = json.loads(json.dumps(context.data, default=list))
+
+        self.assertEqual(json.loads(context.dumps()), expected)
+        self.assertEqual(json.loads(Context.new(data, encoder=json_encoder).dumps()), expected)
+        self.assertEqual(context.dumps(indent=2), json.dumps(context.data, indent=2, default=list))
+        self.assertEqual(Context.new(encoder=lambda obj: 'custom').dumps(), 'custom')
+
+        # default output is the same as json.dumps, orjson is opt in and its format does not depend on values
+        data = {'name': u'caf\xe9', 'l': [1, 2], 'nan': float('nan')}
+        self.assertEqual(Context(data).dumps(), json.dumps(data))
+        if orjson is not None:
+            self.assertEqual(Context.new({'l': [1, 2]}, encoder=orjson_encoder).dumps(), '{"l":[1,2]}')
+            self.assertEqual(Context.new({'l': [1, 2 ** 70]}, encoder=orjson_encoder).dumps(),
+                             '{{"l":[1,{}]}}'.format(2 ** 70))
+
+        self.assertEqual(''.join(context.iterdumps('result.0')), '{"user": {"username": "phonkee", "id": 1}}')
+
+        fp = six.StringIO()
+        context.dump(fp, chunk_size=4, stream=True)
+        self.assertEqual(json.loads(fp.getvalue()), expected)
+
+        # without stream encoder of context is used
+        fp = six.StringIO()
+        Context.new(encoder=lambda obj: 'custom').dump(fp)
+        self.assertEqual(fp.getvalue(), 'custom')
+
+        # dumps of missing item doesn't change context
+        self.assertEqual(context.dumps('missing'), 'null')
+        self.assertNotIn('missing', context)
+
+    def test_load(self):
+        data = {
+            'status': 200,
+            'message': 'OK "quoted" {not} [structure]',
+            'result': [{'user': {'username': 'phonkee', 'tags': ['a', 'b']}}],
+            'big': dict(('key_{}'.format(i), {'value': i, 'name': 'name \\ {}'.format(i)}) for i in range(200)),
+            'empty': {},
+        }
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'data.json')
+        try:
+            with open(path, 'w') as fp:
+                json.dump(data, fp, indent=2)
+
+            self.assertEqual(Context.load(path).data, data)
+
+            for mmap in (False, True):
+                context = Context.load(path, lazy=True, mmap=mmap)
+                self.assertIsInstance(context.data, LazyDict)
+                self.assertEqual(sorted(context.data.deferred()), sorted(data))
+
+                self.assertEqual(context['result.0.user.username'], 'phonkee')
+                self.assertEqual(context['message'], data['message'])
+                self.assertEqual(sorted(context.data.deferred()), ['big', 'empty', 'status'])
+
+                # large objects are indexed as well
+                self.assertEqual(context['big.key_10.value'], 10)
+                self.assertEqual(len(context['big'].deferred()), 199)
+
+                # merges done by C code load deferred values too
+                merged = {}
+                merged.update(context['big'])
+                self.assertEqual(merged, data['big'])
+                self.assertEqual(dict(context['big']), data['big'])
+                self.assertEqual(dict(**context['big']), data['big'])
+
+                self.assertEqual(json.loads(context.dumps()), data)
+                self.assertEqual(json.loads(context.dumps(indent=2)), data)
+                self.assertEqual(context.data, data)
+                self.assertEqual(len(context.keys()), 2 + 3 + 400)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_snapshot(self):
+        context = Context.new({
+            'big': dict(('key_{}'.format(i), {'value': i, 'ratio': i / 2.0, 'tags': ['a', None]}) for i in range(200)),
+            'ints': {0: 'zero', 1: (True, False)},
+            'huge': 1 << 70,
+            'raw': b'bytes',
+        }, sparse_threshold=100)
+        context['sparse.1000'] = 'x'
+
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'data.snapshot')
+        try:
+            for compress in (False, True):
+                context.save_snapshot(path, compress=compress)
+
+                self.assertEqual(Context.load_snapshot(path, lazy=False).data, context.data)
+
+                for mmap in (False, True):
+                    loaded = Context.load_snapshot(path, mmap=mmap)
+                    self.assertIsInstance(loaded.data, LazyDict)
+                    self.assertEqual(sorted(loaded.data.deferred()), ['big', 'ints', 'sparse'])
+
+                    self.assertEqual(loaded['big.key_10.tags'], ['a', None])
+                    self.assertEqual(len(loaded['big'].deferred()), 199)
+                    self.assertEqual(loaded['ints.1'], (True, False))
+                    self.assertIsInstance(loaded['sparse'], SparseList)
+                    self.assertEqual(loaded.data, context.data)
+
+            # large lists and tuples are decoded lazily too (cached or decoded on every access)
+            data = {'rows': [{'id': i, 'tags': ['x']} for i in range(300)] + [1],
+                    'pairs': tuple([i] for i in range(600))}
+            for cache in (True, False):
+                loaded = snapshot.loads(snapshot.dumps(data), cache=cache)
+                rows, pairs = loaded['rows'], loaded['pairs']
+                self.assertIsInstance(rows, LazyList)
+                self.assertIsInstance(pairs, LazyTuple)
+                self.assertEqual(len(rows.deferred()), 300)
+
+                context = Context.from_data(loaded, expand_dots=False)
+                self.assertEqual(context['rows.10.tags.0'], 'x')
+                self.assertEqual(context['pairs.-1'], [599])
+                self.assertIs(rows[10] is rows[10], cache)
+                self.assertEqual(len(rows.deferred()), 299 if cache else 300)
+                self.assertEqual(json.loads(context.dumps()), json.loads(json.dumps(data)))
+                self.assertEqual(snapshot.loads(snapshot.dumps(loaded)), data)
+                self.assertEqual(loaded, data)
+                self.assertEqual(copy.deepcopy(loaded), data)
+                self.assertEqual(rows[-1], 1)
+                self.assertIn({'id': 5, 'tags': ['x']}, rows)
+
+            self.assertRaises(ValueError, Context.load_snapshot, six.BytesIO(b'{"not": "snapshot"}'))
+            self.assertRaises(TypeError, Context({'value': object()}).save_snapshot, six.BytesIO())
+        finally:
+            shutil.rmtree(directory)
+
+    @unittest.skipIf(shared.shared_memory is None, 'shared memory is not supported')
+    def test_shared(self):
+        context = Context({'big': dict(('key_{}'.format(i), {'value': i}) for i in range(500)), 'ints': {0: 'a'}})
+
+        with context.freeze() as frozen:
+            attached = SharedContext.attach(frozen.name)
+            try:
+                for shared_context in (frozen, attached, pickle.loads(pickle.dumps(frozen))):
+                    self.assertEqual(shared_context['big.key_5.value'], 5)
+                    self.assertEqual(shared_context['ints.0'], 'a')
+                    self.assertEqual(shared_context.keys(), context.keys())
+                    self.assertEqual(json.loads(shared_context.dumps()), json.loads(context.dumps()))
+                    self.assertIsNone(shared_context.get('missing'))
+                    # decoded values are not kept by process
+                    self.assertEqual(sorted(shared_context.data.deferred()), ['big', 'ints'])
+
+                self.assertRaises(TypeError, operator.setitem, attached, 'big.key_5.value', 1)
+                self.assertRaises(TypeError, operator.delitem, attached, 'ints')
+                self.assertRaises(TypeError, attached.set_many, {'a': 1})
+
+                copied = attached.copy()
+                copied['big.key_5.value'] = 'changed'
+                self.assertEqual(attached['big.key_5.value'], 5)
+            finally:
+                attached.close()
+
+    def test_path_index(self):
+        context = Context.new({'users': [{'name': 'a'}, {'name': 'b'}], 'obj': {'status': 1}}, path_index=True)
+
+        def check():
+            index, context._index = context._index, None
+            expected = context.keys(), context.keys('users', strip=True)
+            context._index = index
+            self.assertEqual((context.keys(), context.keys('users', strip=True)), expected)
+
+        self.assertIn('users.1.name', context)
+        self.assertNotIn('users.2', context)
+        self.assertEqual(context.keys('users.0'), ['users.0.name'])
+        self.assertEqual(context.keys('obj.status', strip=True), [''])
+
+        context['users.4.name'] = 'e'
+        check()
+        self.assertIn('users.3', context)
+
+        del context['users.0']
+        check()
+        self.assertEqual(context.keys('users.0'), ['users.0.name'])
+
+        context['obj.status.code'] = 200
+        context.pop('users.3')
+        context.update({'other': {'x': 1}})
+        check()
+        self.assertIn('obj.status.code', context)
+
+        # values behind objects are not indexed
+        context['obj.upper'] = 'a'
+        self.assertIn('obj.upper.upper', context)
+
+        context.data['direct'] = 1
+        self.assertNotIn('direct', context)
+        context.reindex()
+        self.assertIn('direct', context)
+
+        copied = context.copy(cow=True)
+        copied['users.0.name'] = 'changed'
+        copied['new'] = 1
+        self.assertNotIn('new', context)
+        self.assertIn('new', copied)
+
+    def test_view(self):
+        context = Context.new({'services': {'api': {'port': 80, 'hosts': ['a']}}}, path_index=True)
+        view = context.view('services.api')
+
+        self.assertIs(view.data, context['services.api'])
+        self.assertEqual(view['port'], 80)
+        self.assertEqual(view.keys(), ['hosts.0', 'port'])
+
+        view['hosts.1'] = 'b'
+        view['tls.enabled'] = True
+        del view['port']
+        self.assertEqual(context['services.api'], {'hosts': ['a', 'b'], 'tls': {'enabled': True}})
+        self.assertIn('services.api.tls.enabled', context)
+        self.assertNotIn('services.api.port', context)
+
+        nested = view.view('tls')
+        nested['enabled'] = False
+        self.assertEqual(context['services.api.tls.enabled'], False)
+
+        copied = view.copy(cow=True)
+        context['services.api.hosts.0'] = 'changed'
+        self.assertEqual(copied['hosts.0'], 'a')
+        self.assertEqual(view['hosts.0'], 'changed')
+
+        self.assertEqual(view.copy()['tls.enabled'], False)
+
+        hosts = view.view('hosts')
+        self.assertEqual(hosts.copy_value(), ['changed', 'b'])
+        self.assertRaises(TypeError, hosts.copy)
+        self.assertRaises(TypeError, hosts.copy, cow=True)
+
+        self.assertRaises(KeyError, context.view, 'missing')
+        self.assertRaises(TypeError, context.view, 'services.api.hosts.0')
+
+    def test_layered(self):
+        defaults = Context({'db': {'host': 'localhost', 'port': 5432}, 'debug': False})
+        config = LayeredContext({'db': {'host': 'db'}}, defaults, cache=True)
+
+        self.assertEqual(config['db.host'], 'db')
+        self.assertEqual(config['db.port'], 5432)
+        self.assertIn('debug', config)
+        self.assertNotIn('db.user', config)
+        self.assertRaises(KeyError, lambda: config['db.user'])
+        self.assertEqual(config.keys(), ['db.host', 'db.port', 'debug'])
+        self.assertEqual(config.data, {'db': {'host': 'db', 'port': 5432}, 'debug': False})
+
+        # changes of layers invalidate cached resolution
+        defaults['db.user'] = 'admin'
+        self.assertEqual(config['db.user'], 'admin')
+        del config['db.host']
+        self.assertEqual(config['db.host'], 'localhost')
+
+        request = config.new_child()
+        request['debug'] = True
+        self.assertEqual(request['debug'], True)
+        self.assertEqual(config['debug'], False)
+        self.assertEqual(request.parents.keys(), config.keys())
+
+        # scalar of upper layer shadows subtree of lower layer, containers are merged, empty ones are kept
+        layered = LayeredContext(Context({'db': 'sqlite', 'a': {'x': 1}, 'tags': []}),
+                                 Context({'db': {'host': 'h'}, 'a': {'y': 2}}))
+        self.assertEqual(layered['db'], 'sqlite')
+        self.assertNotIn('db.host', layered)
+        self.assertEqual(layered['a'], {'x': 1, 'y': 2})
+        self.assertEqual(layered.keys(), ['a.x', 'a.y', 'db'])
+        self.assertEqual(layered.data, {'db': 'sqlite', 'a': {'x': 1, 'y': 2}, 'tags': []})
+        self.assertEqual(json.loads(layered.dumps()), layered.data)
+
+        # only subtree of item is merged (other items are not resolved)
+        def fail():
+            raise AssertionError('resolved')
+
+        layered.layers[1]['other'] = fail
+        self.assertEqual(layered.keys('a'), ['a.x', 'a.y'])
+        self.assertEqual(layered.items('a', strip=True), [('x', 1), ('y', 2)])
+        self.assertEqual(layered.items('db'), [('db', 'sqlite')])
+        self.assertEqual(json.loads(layered.dumps('a')), {'x': 1, 'y': 2})
+        self.assertEqual(layered.dumps('missing'), 'null')
+        self.assertRaises(KeyError, layered.keys, 'missing')
+
+    def test_select(self):
+        context = Context({
+            'users': [{'email': 'a@x'}, {'email': 'b@x'}, {'name': 'c'}],
+            'services': {'api': {'port': 80, 'db': {'port': 5432}}, 'port': 1},
+        })
+
+        self.assertEqual(context.find_all('users.*.email'), [('users.0.email', 'a@x'), ('users.1.email', 'b@x')])
+        self.assertEqual(context.find_all('users.1:3.email'), [('users.1.email', 'b@x')])
+        self.assertEqual(context.find_all('users.::2'), [('users.0', {'email': 'a@x'}), ('users.2', {'name': 'c'})])
+        self.assertEqual(
+            context.find_all('services.**.port', sort=True),
+            [('services.port', 1), ('services.api.port', 80), ('services.api.db.port', 5432)],
+        )
+        self.assertEqual(sorted(context.find_all('**.**.port')), sorted(context.find_all('**.port')))
+        self.assertEqual(context.find_all('missing.*'), [])
+
+        context['lazy'] = {'value': lambda: 'resolved'}
+        self.assertEqual(next(context.select('lazy.*')), ('lazy.value', 'resolved'))
+
+    def test_column(self):
+        context = Context({'results': [{'metrics': {'latency': 1.5}}, {'metrics': {}}, {'metrics': {'latency': 3}}]})
+
+        self.assertEqual(context.column('results', 'metrics.latency'), [1.5, None, 3])
+        self.assertEqual(context.column('results', 'metrics.latency', dtype='d', default=0).tolist(), [1.5, 0.0, 3.0])
+        self.assertRaises(KeyError, context.column, 'results', 'metrics.latency', strict=True)
+        self.assertRaises(TypeError, context.column, 'results.0', 'metrics')
+
+        context.set_column('results', 'metrics.latency', [1, 2, 3, 4])
+        self.assertEqual(context.column('results', 'metrics.latency'), [1, 2, 3, 4])
+
+        copied = context.copy(cow=True)
+        copied.set_column('results', 'metrics.latency', [0])
+        self.assertEqual(copied['results.0.metrics.latency'], 0)
+        self.assertEqual(context['results.0.metrics.latency'], 1)
+
+        # same result with or without path index, values that are not lists are replaced, dicts are refused
+        for path_index in (False, True):
+            context = Context.new({'scalar': 'value', 'dict': {'a': 1}}, path_index=path_index)
+            context.set_column('scalar', 'v', [1, 2])
+            context.set_column('missing', 'v', [3])
+            self.assertEqual(context['scalar'], [{'v': 1}, {'v': 2}])
+            self.assertEqual(context['missing'], [{'v': 3}])
+            self.assertRaises(TypeError, context.set_column, 'dict', 'v', [1])
+            self.assertEqual(context['dict'], {'a': 1})
+
+        # set is atomic, values set before failure are reverted
+        def values():
+            yield 10
+            yield 20
+            raise ValueError('broken')
+
+        for path_index in (False, True):
+            context = Context.new({'rows': [{'v': 1}], 'scalar': 'value'}, path_index=path_index, journal=True)
+            token = context.checkpoint()
+            for item in ('rows', 'scalar', 'missing'):
+                self.assertRaises(ValueError, context.set_column, item, 'v', values())
+            self.assertEqual(context.data, {'rows': [{'v': 1}], 'scalar': 'value'})
+            self.assertEqual(context.diff(token), {'set': {}, 'delete': []})
+            self.assertEqual(context.keys(), ['rows.0.v', 'scalar'])
+
+    def test_many(self):
+        context = Context.new({'response': {'items': [1]}}, path_index=True)
+
+        context.set_many({'response.user.name': 'phonkee', 'response.user.id': 1, 'response.items.2': 3})
+        self.assertEqual(context['response'], {'items': [1, None, 3], 'user': {'name': 'phonkee', 'id': 1}})
+        self.assertIn('response.user.id', context)
+
+        self.assertEqual(
+            context.get_many(['response.user.id', 'response.missing', 'response.items.0'], default='-'),
+            [1, '-', 1],
+        )
+
+        # failed batch is rolled back completely
+        before = json.dumps(context.data, sort_keys=True)
+        self.assertRaises(IndexError, context.set_many, [('response.new.value', 1), ('response.items.-9', 0)])
+        self.assertEqual(json.dumps(context.data, sort_keys=True), before)
+        self.assertNotIn('response.new', context)
+
+        # indexes refer to data before delete
+        self.assertRaises(KeyError, context.delete_many, ['response.items.0', 'response.missing'])
+        self.assertEqual(context['response.items'], [1, None, 3])
+        context.delete_many(['response.items.0', 'response.items.2', 'response.user.id'])
+        self.assertEqual(context['response'], {'items': [None], 'user': {'name': 'phonkee'}})
+        self.assertEqual(context.keys(), ['response.items.0', 'response.user.name'])
+
+    def test_memoize(self):
+        calls = []
+
+        def settings():
+            calls.append(1)
+            return {'db': {'host': 'localhost'}}
+
+        context = Context.new({'settings': settings}, memoize=2)
+
+        self.assertEqual(context['settings.db.host'], 'localhost')
+        self.assertEqual(context.view('settings')['db.host'], 'localhost')
+        self.assertEqual(context['settings']['db']['host'], 'localhost')
+        self.assertEqual(len(calls), 1)
+
+        context['other'] = lambda: 'other'
+        self.assertEqual(context['other'], 'other')
+        context.invalidate('settings.db')
+        self.assertEqual(list(context._memo._entries), [('other',)])
+        self.assertEqual(list(context._memo._tree), ['other'])
+        context['settings']
+        self.assertEqual(len(calls), 2)
+
+        # size bounded, least recently used result is evicted
+        context['other'] = lambda: 'other'
+        context['another'] = lambda: 'another'
+        self.assertEqual(context['other'] + context['another'], 'otheranother')
+        context['settings']
+        self.assertEqual(len(calls), 3)
+
+        # change made by context invalidates result
+        context['settings'] = settings
+        context['settings']
+        self.assertEqual(len(calls), 4)
+
+        context.enable_memo(ttl=0)
+        context['settings']
+        context['settings']
+        self.assertEqual(len(calls), 6)
+
+        # bulk reads and traversals share memo with item access
+        def value():
+            calls.append(1)
+            return 'x'
+
+        del calls[:]
+        context = Context.new({'s': {'x': value}, 'rows': [{'v': value}]}, memoize=True)
+        context['s.x']
+        context['rows.0.v']
+        self.assertEqual(context.get_many(['s.x', 'rows.0.v']), ['x', 'x'])
+        self.assertEqual(context.items(), [('rows.0.v', 'x'), ('s.x', 'x')])
+        self.assertEqual(context.find_all('s.*'), [('s.x', 'x')])
+        self.assertEqual(context.column('rows', 'v'), ['x'])
+        self.assertEqual(len(calls), 2)
+
+    @unittest.skipIf(six.PY2, 'asyncio is python 3 only')
+    def test_async(self):
+        import asyncio
+
+        calls = []
+
+        def fetch(value, delay=0.1):
+            calls.append(value)
+            return asyncio.sleep(delay, result=value)
+
+        context = Context({
+            'user': lambda: fetch({'name': 'phonkee', 'roles': fetch(['admin'])}),
+            'stats': fetch(42),
+            'plain': 1,
+        })
+
+        loop = asyncio.new_event_loop()
+        try:
+            started = time.time()
+            result = loop.run_until_complete(context.resolve(['user.name', 'stats', 'user.roles.0', 'plain']))
+            elapsed = time.time() - started
+            self.assertEqual(result, ['phonkee', 42, 'admin', 1])
+            self.assertEqual(len(calls), 3)
+            # user and stats are fetched concurrently, roles after user
+            self.assertLess(elapsed, 0.3)
+
+            # results are cached in data
+            self.assertEqual(context['user.roles'], ['admin'])
+            self.assertEqual(loop.run_until_complete(context.view('user').aget('roles.0')), 'admin')
+            self.assertEqual(len(calls), 3)
+            self.assertRaises(KeyError, loop.run_until_complete, context.aget('user.missing'))
+
+            # cancelled resolve restores original value
+            remote = lambda: fetch('remote', delay=1)
+            context['remote'] = remote
+            self.assertRaises(asyncio.TimeoutError, loop.run_until_complete,
+                              asyncio.wait_for(context.aget('remote'), 0.01))
+            self.assertIs(context.data['remote'], remote)
+
+            # copy on write context does not change shared data
+            context['lazy'] = {'value': lambda: fetch(1, delay=0)}
+            copied = context.copy(cow=True)
+            self.assertEqual(loop.run_until_complete(copied.aget('lazy.value')), 1)
+            self.assertEqual(copied.data['lazy'], {'value': 1})
+            self.assertTrue(callable(context.data['lazy']['value']))
+        finally:
+            loop.close()
+
+    def test_benchmarks(self):
+        results = benchmarks.run(repeat=1, min_time=0, depth=2, width=2, length=3, keys=5, combinations=[2])
+
+        self.assertIn('getitem', results)
+        self.assertIn('expand[2]', results)
+        self.assertEqual(benchmarks.compare(results, results), [])
+
+        slower = dict((name, {'best': result['best'] * 2}) for name, result in results.items())
+        self.assertEqual(len(benchmarks.compare(slower, results, threshold=1.5)), len(results))
+
+        # items are spread across all leaves
+        items = benchmarks.make_items(benchmarks.make_data(2, 3, 10), 10)
+        self.assertTrue(any(item.startswith('tree.') for item in items))
+        self.assertTrue(any(item.startswith('list.') for item in items))
+
+        params = {'depth': 2, 'keys': 5}
+        self.assertEqual(benchmarks.changed_params(params, {'params': params}), [])
+        self.assertEqual(benchmarks.changed_params(params, {'params': {'depth': 3, 'keys': 5}}), ['depth'])
+
+    def test_stats(self):
+        context = Context({'settings': {'debug': lambda: True}})
+        self.assertIsNone(context.stats())
+
+        calls = []
+        context.enable_stats(hooks=[lambda operation, item, elapsed: calls.append((operation, item))])
+
+        self.assertTrue(context['settings.debug'])
+        context['settings.level'] = 1
+        del context['settings.level']
+        self.assertRaises(KeyError, lambda: context['settings.level'])
+
+        stats = context.stats()
+        self.assertEqual(stats['items']['settings.debug'], {'get': 1, 'set': 0, 'delete': 0, 'miss': 0})
+        self.assertEqual(stats['items']['settings.level'], {'get': 0, 'set': 1, 'delete': 1, 'miss': 1})
+        self.assertEqual(stats['totals'], {'get': 1, 'set': 1, 'delete': 1, 'miss': 1})
+        self.assertEqual(sorted(stats['timings']), ['build', 'parse', 'resolve', 'traverse'])
+        self.assertEqual(calls, [
+            ('get', 'settings.debug'), ('set', 'settings.level'), ('delete', 'settings.level'),
+            ('miss', 'settings.level'),
+        ])
+
+        context.reset_stats()
+        self.assertEqual(context.stats()['items'], {})
+
+        # accessors, bulk operations and "in" are counted as well
+        accessor = Accessor('settings.debug')
+        for _ in range(5):
+            accessor.get(context)
+        self.assertTrue(accessor.exists(context))
+        Accessor('settings.level').set(context, 1)
+        self.assertEqual(context.get_many(['settings.debug', 'missing']), [True, None])
+        context.set_many({'a': 1, 'b': 2})
+        context.delete_many(['a', 'b'])
+        self.assertRaises(KeyError, context.delete_many, ['settings.level', 'a'])
+        self.assertIn('settings.level', context)
+
+        stats = context.stats()
+        self.assertEqual(stats['items']['settings.debug'], {'get': 7, 'set': 0, 'delete': 0, 'miss': 0})
+        self.assertEqual(stats['items']['a'], {'get': 0, 'set': 1, 'delete': 1, 'miss': 1})
+        self.assertEqual(stats['items']['settings.level'], {'get': 1, 'set': 1, 'delete': 0, 'miss': 0})
+        self.assertEqual(stats['totals'], {'get': 8, 'set': 3, 'delete': 2, 'miss': 2})
+
+        # access through view is recorded by root context with full items
+        context['settings.nested'] = {}
+        view = context.view('settings').view('nested')
+        context.reset_stats()
+        view['x'] = 1
+        self.assertEqual(view['x'], 1)
+        self.assertIn('x', view)
+        self.assertEqual(Accessor('x').get(view), 1)
+        self.assertEqual(view.get_many(['x', 'y']), [1, None])
+        del view['x']
+        self.assertEqual(context.stats()['items']['settings.nested.x'], {'get': 4, 'set': 1, 'delete': 1, 'miss': 0})
+        self.assertEqual(context.stats()['items']['settings.nested.y'], {'get': 0, 'set': 0, 'delete': 0, 'miss': 1})
+
+    def test_journal(self):
+        context = Context.new({'user': {'name': 'phonkee', 'roles': ['a', 'b']}, 'stats': {'count': 1}}, journal=True)
+        replica = context.copy()
+        token = context.checkpoint()
+
+        context['stats.count'] = 2
+        context['stats.last'] = 'now'
+        del context['user.roles.0']
+        context.pop('user.name')
+
+        self.assertEqual(context.diff(token), {
+            'set': {'stats.count': 2, 'stats.last': 'now', 'user.roles': ['b']},
+            'delete': ['user.name'],
+        })
+        self.assertEqual(context.diff(token, format='json-patch'), [
+            {'op': 'add', 'path': '/stats/count', 'value': 2},
+            {'op': 'add', 'path': '/stats/last', 'value': 'now'},
+            {'op': 'remove', 'path': '/user/name'},
+            {'op': 'add', 'path': '/user/roles', 'value': ['b']},
+        ])
+
+        for format in ('dotted', 'json-patch'):
+            self.assertEqual(replica.copy().apply_diff(context.diff(token, format=format)).data, context.data)
+
+        token = context.checkpoint(compact=True)
+        self.assertEqual(context.diff(token), {'set': {}, 'delete': []})
+        self.assertRaises(ValueError, context.diff, 0)
+
+        # failed changes are not recorded (and data are not changed)
+        data = context.copy_value()
+        self.assertRaises(IndexError, context.set_many, {'a.key': 1, 'z.-9': 0})
+        self.assertRaises(IndexError, operator.setitem, context, 'b.c.-9', 0)
+        self.assertEqual(context.data, data)
+        self.assertEqual(context.diff(token, format='json-patch'), [])
+        self.assertRaises(ValueError, Context().diff)
+
+    def test_compile(self):
+        context = Context()
+        accessor = Context.compile('result.0.user.username')
+
+        self.assertFalse(accessor.exists(context))
+        self.assertEqual(accessor.get(context, 'default'), 'default')
+        self.assertEqual(context.data, {})
+
+        accessor.set(context, 'phonkee')
+        self.assertTrue(accessor.exists(context))
+        self.assertEqual(accessor.get(context), 'phonkee')
+        self.assertEqual(context['result.0.user.username'], 'phonkee')
+        self.assertEqual(context[accessor], 'phonkee')
+
+        accessor.delete(context)
+        self.assertEqual(context['result.0.user'], {})
+        self.assertRaises(KeyError, accessor.delete, context)
+
     def test_keys(self):
         """
         Test keys method so it works correctly
@@ -70,6 +778,46 @@ class ContextTest(unittest.TestCase):
             result = context.keys(dataitem[1])
             self.assertEqual(list(result), list(dataitem[2]), msg="got {} expected {} for item {}".format(result, dataitem[2], dataitem))
 
+    def test_walk(self):
+        context = Context({'b': [1, {'x': 2}], 'a': {'c': lambda: 3}})
+        context['b.10'] = 'ten'
+
+        self.assertEqual(list(context.walk(sort=True)), [
+            ('a.c', 3), ('b.0', 1), ('b.1.x', 2), ('b.2', None), ('b.3', None), ('b.4', None), ('b.5', None),
+            ('b.6', None), ('b.7', None), ('b.8', None), ('b.9', None), ('b.10', 'ten'),
+        ])
+        self.assertEqual(list(context.walk('b.1', sort=True)), [('b.1.x', 2)])
+        self.assertEqual(list(context.walk('b.1', strip=True)), [('x', 2)])
+        self.assertEqual(list(context.walk('a.c')), [('a.c', 3)])
+        self.assertEqual(list(context.walk(sort=True, max_depth=1)), [('a', context['a']), ('b', context['b'])])
+        self.assertEqual(context.items(item='b.1'), [('b.1.x', 2)])
+        self.assertEqual(context.keys()[:3], ['a.c', 'b.0', 'b.1.x'])
+
+    def test_copy_on_write(self):
+        context = Context({'a': {'b': {'c': 1}, 'd': [1, 2]}, 'e': {'f': 1}})
+        cow = context.copy(cow=True)
+        self.assertEqual(cow.data, context.data)
+        self.assertIs(cow['a'], context['a'])
+
+        cow['a.b.c'] = 2
+        del cow['a.d.0']
+        self.assertEqual(cow.data, {'a': {'b': {'c': 2}, 'd': [2]}, 'e': {'f': 1}})
+        self.assertEqual(context.data, {'a': {'b': {'c': 1}, 'd': [1, 2]}, 'e': {'f': 1}})
+        self.assertIs(cow['e'], context['e'])
+
+        # original context does not change shared nodes either
+        context['e.f'] = 2
+        self.assertEqual(cow['e.f'], 1)
+        self.assertEqual(context['e.f'], 2)
+
+        # replaced and deleted nodes are not kept by copy on write context
+        for i in range(100):
+            cow['a'] = {}
+            cow['a.b'] = i
+        del cow['e']
+        self.assertEqual(cow.data, {'a': {'b': 99}})
+        self.assertEqual(len(cow._owned), 2)
+
     def test_expand(self):
         """
         Test expand functionality
@@ -100,6 +848,132 @@ class ContextTest(unittest.TestCase):
             context = Context(inp)
             self.assertEqual(list(context.expand()), expected)
 
+    def test_expand_template(self):
+        context = Context({
+            'fixed': {'deep': {'value': 1}},
+            'items': [{'name': {'__choices__': ['a', 'b']}}, {'other': 1}],
+        })
+        expanded = list(context.expand())
+
+        self.assertEqual(expanded, [
+            {'fixed': {'deep': {'value': 1}}, 'items': [{'name': 'a'}, {'other': 1}]},
+            {'fixed': {'deep': {'value': 1}}, 'items': [{'name': 'b'}, {'other': 1}]},
+        ])
+
+        # values that are not expanded are shared with template
+        self.assertIs(expanded[0]['fixed'], context['fixed'])
+        self.assertIs(expanded[1]['items'][1], context['items.1'])
+        self.assertEqual(context['items.0.name'], {'__choices__': ['a', 'b']})
+
+        contexts = list(context.expand(as_context=True))
+        self.assertEqual(contexts[1]['items.0.name'], 'b')
+
+        # contexts are copy on write, changes don't leak to template nor siblings
+        contexts[0]['fixed.deep.value'] = 99
+        contexts[0]['items.1.other'] = 2
+        contexts[0]['items.0.name'] = 'c'
+        self.assertEqual(context['fixed.deep.value'], 1)
+        self.assertEqual(context['items.1.other'], 1)
+        self.assertEqual(contexts[1]['fixed.deep.value'], 1)
+        self.assertEqual(contexts[1]['items.1.other'], 1)
+        self.assertEqual(contexts[1]['items.0.name'], 'b')
+        self.assertEqual(contexts[0]['fixed.deep.value'], 99)
+
+        view = context.expand(view=True)[1]
+        self.assertEqual(view['items'][0]['name'], 'b')
+        self.assertEqual(view, expanded[1])
+
+    def test_expand_lazy(self):
+        context = Context({
+            'a': {'__range__': [3]},
+            'b': {'__choices__': ['x', 'y']},
+            'c': {'__range__': [10, 14]},
+        })
+        expected = [
+            {'a': a, 'b': b, 'c': c} for b in ['x', 'y'] for a in range(3) for c in range(10, 14)
+        ]
+
+        expansion = context.expand()
+        self.assertEqual(len(expansion), 24)
+        self.assertEqual(list(expansion), expected)
+        self.assertEqual(expansion[5], expected[5])
+        self.assertEqual(expansion[-1], expected[-1])
+        self.assertRaises(IndexError, operator.getitem, expansion, 24)
+        self.assertEqual(list(expansion.slice(3, 20, 4)), expected[3:20:4])
+        self.assertEqual(list(expansion.slice(-2)), expected[-2:])
+        self.assertEqual(expansion.combination(1), {'b': 'x', 'a': 0, 'c': 11})
+
+        views = list(context.expand(view=True))
+        self.assertEqual(views, expected)
+        self.assertEqual(views[7]['c'], 13)
+
+        sharded = []
+        for index in range(5):
+            sharded.extend(expansion.shard(index, of=5))
+        self.assertEqual(sharded, expected)
+
+    def test_expand_constraints(self):
+        context = Context({
+            'a': {'__range__': [4], '__exclude__': [3]},
+            'b': {'__choices__': ['x', 'y', [1]], '__exclude__': [[1]], '__exclude_if__': [{'a': 1, 'b': 'y'}]},
+            'c': {'__range__': [5], '__format__': 'c{value}', '__exclude__': ['c4']},
+        })
+
+        def predicate(partial):
+            return partial.get('a') != 2 and partial.get('c') != 'c0'
+
+        expected = [
+            {'a': a, 'b': b, 'c': 'c{}'.format(c)}
+            for b in ['x', 'y'] for a in range(3) for c in range(1, 4)
+            if a != 2 and (a, b) != (1, 'y')
+        ]
+
+        expansion = context.expand(predicate=predicate)
+        self.assertEqual(expansion.size, 2 * 3 * 4)
+        self.assertEqual(len(expansion), expansion.size)
+        self.assertEqual(expansion.count(), len(expected))
+        self.assertEqual(list(expansion), expected)
+        self.assertEqual(list(expansion.slice(step=2)), [e for e in expected if e['c'] == 'c2'])
+        self.assertEqual(expansion[1], {'a': 0, 'b': 'x', 'c': 'c1'})
+        self.assertRaises(IndexError, operator.getitem, expansion, 0)
+
+        sharded = []
+        for index in range(4):
+            sharded.extend(expansion.shard(index, of=4))
+        self.assertEqual(sharded, expected)
+
+        calls = []
+        for _ in context.expand(predicate=lambda partial: calls.append(partial) or 'a' in partial):
+            pass
+        # first slot is b and all its values are excluded, so predicate is called only for b
+        self.assertEqual(calls, [{'b': 'x'}, {'b': 'y'}])
+
+    @unittest.skipIf(six.PY2, 'concurrent.futures is python 3 only')
+    def test_expand_parallel(self):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        context = Context({'a': {'__range__': [30]}, 'b': {'__choices__': ['x', 'y', 'z']}})
+        expected = [dump_expanded(item) for item in context.expand()]
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(context.expand(callback=dump_expanded, executor=executor))
+            self.assertEqual(results, expected)
+
+            results = context.expand().map(dump_expanded, executor=executor, ordered=False, chunksize=7)
+            self.assertEqual(sorted(results), sorted(expected))
+
+        results = list(context.expand(callback=dump_expanded, workers=2))
+        self.assertEqual(results, expected)
+
+        # process pool given by caller receives expansion once per worker
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(context.expand().map(dump_expanded, executor=executor, chunksize=4))
+            self.assertEqual(results, expected)
+            results = context.expand().map(dump_expanded, executor=executor, ordered=False, chunksize=4)
+            self.assertEqual(sorted(results), sorted(expected))
+
+        self.assertEqual(list(context.expand(callback=dump_expanded)), expected)
+
 
 if __name__ == "__main__":
     unittest.main()